@@ -0,0 +1,7 @@
+from risk_dash import market_data as md, results as rs
+
+# Shared local cache so repeated dashboards skip the market data round trips
+cache = md.MarketDataCache()
+
+# Server side store of single ticker results shared by every worker, callbacks pass only its keys
+results = rs.ResultStore()
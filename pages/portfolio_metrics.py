@@ -5,6 +5,7 @@ import dash_html_components as html
 import dash_table as dt
 from dash.dependencies import Input, Output
 from app import app
+from pages import cache
 
 import base64
 import io
@@ -20,21 +21,11 @@ from datetime import datetime
 import urllib
 
 def create_portoflio(input):
-    temp = []
-    for i in input.index:
-        tempdata = md.QuandlStockData(apikey, input.loc[i, 'Ticker'], days=80)
-        tempsecurity = sec.Equity(
-            input.loc[i, 'Ticker'],
-            market_data = tempdata,
-            ordered_price = input.loc[i, 'Ordered Price'],
-            quantity=input.loc[i, 'Quantity'],
-            date_ordered=input.loc[i, 'Ordered Date'])
-        temp.append(tempsecurity)
-    outport = sec.Portfolio(temp)
+    outport = sec.Portfolio(data_input=input, apikey=apikey, cache=cache)
     return(outport)
 
 def create_template():
-    csv_string = 'Type,Ticker,Ordered Date,Ordered Price,Quantity\n'
+    csv_string = 'Type,Ticker,Ordered Date,Ordered Price,Quantity,Strike,Expiry,Option Type\n'
     csv_string = 'data:text/csv;charset=utf-8,' + urllib.parse.quote(csv_string)
     return(csv_string)
 
@@ -98,7 +89,7 @@ layout = html.Div(
             html.Div(
                 dt.DataTable(
                     data=[{} for i in range(10)],
-                    columns = ['Type','Ticker', 'Ordered Date', 'Ordered Price', 'Quantity'],
+                    columns = ['Type','Ticker', 'Ordered Date', 'Ordered Price', 'Quantity', 'Strike', 'Expiry', 'Option Type'],
                     id='portfolio'
                 ),
                 className='col-md-12'
@@ -120,6 +111,28 @@ layout = html.Div(
                 className ='col-md-6'
             )],
             className='row'
+        ),
+        html.Div(
+            html.Div(
+                [html.H3('VaR Attribution'),
+                html.Table(
+                    id='attribution',
+                    className = 'table'
+                )],
+                className='col-md-12'
+            ),
+            className='row'
+        ),
+        html.Div(
+            html.Div(
+                [html.H3('Worst Stress Scenarios'),
+                html.Table(
+                    id='stress',
+                    className = 'table'
+                )],
+                className='col-md-12'
+            ),
+            className='row'
         )
     ]
 )
@@ -133,44 +146,84 @@ def output_upload(contents, filename):
         data = df.to_dict('records')
         return(data)
 
-@app.callback(Output('mtm', 'children'),
+@app.callback([Output('mtm', 'children'),
+               Output('attribution', 'children'),
+               Output('stress', 'children')],
               [Input('portfolio', 'data')])
-def displayport(contents):
+def display_portfolio(contents):
+    # The tables share one portfolio so every upload loads the market data and builds the panel once
     if contents is not None and contents != [{}]:
         df = pd.DataFrame.from_dict(contents)
         portfolio = create_portoflio(df)
-        portfolio.mark()
-        marked = portfolio.marked_portfolio
-        df['Type'] = [i + ' Equity' for i in df['Ticker']]
-        df.loc[:,'Current Price'] = df['Type'].map(
-            {
-                i : portfolio.port[i].market_data.current_price()
-                for i in portfolio.port.keys()
-            }
-        )
-        df.loc[:,'Initial Value'] = df['Type'].map(
-            {i : j[0] for i, j in marked.items()}
-        )
-        df.loc[:,'Market Value'] = df['Type'].map(
-            {i : j[1] for i, j in marked.items()}
+        return displayport(portfolio), display_attribution(portfolio), display_stress(portfolio)
+    return None, None, None
+
+def displayport(portfolio):
+    portfolio.mark()
+    marked = portfolio.marked_portfolio
+    # One row per position, options are marked at their model price rather than the underlying's
+    df = pd.DataFrame({
+        'Position': list(marked.keys()),
+        'Initial Value': [i[0] for i in marked.values()],
+        'Market Value': [i[1] for i in marked.values()]
+    })
+    df.loc[:,'Current Price'] = df['Market Value'] / [portfolio.port[i].quantity for i in df['Position']]
+    df.loc[:,'Return %'] = ((df['Market Value'] - df['Initial Value']) / df['Initial Value'].abs()) * 100
+    df = df[['Position', 'Current Price', 'Initial Value', 'Market Value', 'Return %']]
+    header = df.columns.tolist()
+    tbl = [html.Tr([html.Th(i) for i in header])]
+    tbl = tbl + [html.Tr([html.Td(j) for j in df.loc[i]]) for i in df.index]
+    tbl += [
+        html.Tr(
+            [
+            html.Td('Total'),
+            html.Td(''),
+            html.Td(df['Initial Value'].sum()),
+            html.Td(df['Market Value'].sum()),
+            html.Td(((df['Market Value'].sum() - df['Initial Value'].sum()) / df['Initial Value'].sum()) * 100)
+        ]
         )
-        df.loc[:,'Return %'] = ((df['Market Value'] - df['Initial Value']) / df['Initial Value'].abs()) * 100
-        df = df[['Ticker', 'Current Price', 'Initial Value', 'Market Value', 'Return %']]
-        header = df.columns.tolist()
-        tbl = [html.Tr([html.Th(i) for i in header])]
-        tbl = tbl + [html.Tr([html.Td(j) for j in df.loc[i]]) for i in df.index]
-        tbl += [
-            html.Tr(
-                [
-                html.Td('Total'),
-                html.Td(''),
-                html.Td(df['Initial Value'].sum()),
-                html.Td(df['Market Value'].sum()),
-                html.Td(((df['Market Value'].sum() - df['Initial Value'].sum()) / df['Initial Value'].sum()) * 100)
-            ]
-            )
+    ]
+    return(tbl)
+
+def display_attribution(portfolio):
+    attribution = portfolio.var_attribution()
+    df = pd.DataFrame({
+        'Position': attribution.index,
+        'Weight': attribution['weight'].round(4).values,
+        'Marginal VaR': attribution['marginal_var'].round(4).values,
+        'Component VaR': attribution['component_var'].round(4).values,
+        'Component %': (attribution['component_percent'] * 100).round(2).values,
+        'Incremental VaR': attribution['incremental_var'].round(4).values
+    })
+    header = df.columns.tolist()
+    tbl = [html.Tr([html.Th(i) for i in header])]
+    tbl = tbl + [html.Tr([html.Td(j) for j in df.loc[i]]) for i in df.index]
+    tbl += [
+        html.Tr(
+            [
+            html.Td('Total'),
+            html.Td(''),
+            html.Td(''),
+            html.Td(round(portfolio.parametric_portfolio_value_at_risk, 4)),
+            html.Td(100),
+            html.Td('')
         ]
-        return(tbl)
+        )
+    ]
+    return(tbl)
+
+def display_stress(portfolio):
+    hypothetical = {
+        'All positions ' + str(i) + '%': {key: i / 100 for key in portfolio.port.keys()}
+        for i in (-10, -20, -30)
+    }
+    results = portfolio.stress_test(hypothetical=hypothetical, window_length=10)
+    df = results.head(10).round(2)
+    header = ['Scenario'] + df.columns.tolist()
+    tbl = [html.Tr([html.Th(i) for i in header])]
+    tbl = tbl + [html.Tr([html.Td(i)] + [html.Td(j) for j in df.loc[i]]) for i in df.index]
+    return(tbl)
 
 @app.callback(Output('portfolio_weights', 'figure'),
               [Input('portfolio', 'data')])
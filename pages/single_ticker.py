@@ -10,6 +10,7 @@ import plotly.graph_objs as go
 from dash.dependencies import Input, Output, State
 
 from app import app
+from pages import cache, results
 from risk_dash import market_data as md, simgen as mc
 from apiconfig import quandl_apikey as apikey
 
@@ -115,35 +116,68 @@ layout = dbc.Container([
 
 def get_data(n_clicks,stock, obs, lookback, forward):
     if n_clicks != 0:
-        data = md.QuandlStockData(apikey, stock, days=lookback)
-        gen = mc.NormalDistribution(
-            location = data.currentexmean,
-            scale = data.currentexvol
-        )
-        sim = mc.NaiveMonteCarlo(
-            gen,
-            obs=obs
-        )
-        sim.simulate(forward, obs)
-        dist = sim.simulated_distribution * data.current_price()
-        hist_dist = (data.market_data['percentchange'] * data.current_price()).dropna()
-        return json.dumps(
-            {
-                'data': data.market_data.to_json(date_format='iso', orient='records'),
-                'dist': list(dist),
-                'hist_dist': list(hist_dist),
-                'currentvol': data.currentexvol,
-                'currentexvol': data.currentexvol * np.sqrt(252),
-                'currentswvol': data.currentswvol * np.sqrt(252),
-                'currentexr': (1 + data.currentexmean) ** (252) - 1,
-                'currentswr': (1 + data.currentswmean) ** (252) - 1,
-                'percentVaR': np.nanpercentile(sim.simulated_distribution, 2.5),
-                'forwardSimulationMean': list(np.exp(sim.simulation_mean) * data.current_price()),
-                'forwardSimulationLower': list(np.exp(sim.simulation_mean - 2 * sim.simulation_std) * data.current_price()),
-                'forwardSimulationUpper' : list(np.exp(sim.simulation_mean + 2 * sim.simulation_std) * data.current_price()),
-                'currentprice': data.current_price()
-            }
-        )
+        key = results.entry_key(stock, lookback, obs, forward)
+        results.get_or_compute(key, lambda: simulate_ticker(stock, lookback, obs, forward))
+        return json.dumps({'key': key, 'params': [stock, lookback, obs, forward]})
+
+
+def simulate_ticker(stock, lookback, obs, forward):
+    data = md.QuandlStockData(apikey, stock, days=lookback, cache=cache)
+    gen = mc.NormalDistribution(
+        location = data.currentexmean,
+        scale = data.currentexvol,
+        sampling = 'halton',
+        antithetic = True
+    )
+    sim = mc.NaiveMonteCarlo(
+        gen,
+        obs=obs,
+        control_variate=True
+    )
+    sim.simulate(forward, obs)
+    sim.set_var(2.5)
+    market_data = data.market_data
+    historic = market_data['percentchange'].rolling(forward).sum().values
+    # Both distributions share bin edges so the overlaid bars line up
+    bounds = (
+        np.fmin(sim.summary['minimum'], np.nanmin(historic)),
+        np.fmax(sim.summary['maximum'], np.nanmax(historic))
+    )
+    summaries = {
+        'sim': sim.set_summary(range=bounds),
+        'hist': mc.summarize(historic, range=bounds),
+        'daily': mc.summarize(market_data['percentchange'].values)
+    }
+    output = {
+        'date': market_data.index.values,
+        'adj_open': market_data['adj_open'].values,
+        'adj_high': market_data['adj_high'].values,
+        'adj_low': market_data['adj_low'].values,
+        'adj_close': market_data['adj_close'].values,
+        'currentvol': data.currentexvol,
+        'currentexvol': data.currentexvol * np.sqrt(252),
+        'currentswvol': data.currentswvol * np.sqrt(252),
+        'currentexr': (1 + data.currentexmean) ** (252) - 1,
+        'currentswr': (1 + data.currentswmean) ** (252) - 1,
+        'percentVaR': sim.percentilevar,
+        'forwardSimulationMean': np.exp(sim.simulation_mean) * data.current_price(),
+        'forwardSimulationLower': np.exp(sim.simulation_mean - 2 * sim.simulation_std) * data.current_price(),
+        'forwardSimulationUpper' : np.exp(sim.simulation_mean + 2 * sim.simulation_std) * data.current_price(),
+        'currentprice': data.current_price()
+    }
+    for prefix, summary in summaries.items():
+        output.update({prefix + '_' + name: value for name, value in summary.items()})
+    return output
+
+
+def summary_quantile(data, prefix, percentile):
+    return np.interp(percentile, data[prefix + '_percentiles'], data[prefix + '_quantiles'])
+
+
+def load_result(querydata):
+    # The browser only holds the key, a worker that does not have the result recomputes it from the parameters
+    query = json.loads(querydata)
+    return results.get_or_compute(query['key'], lambda: simulate_ticker(*query['params']))
 
 
 @app.callback(
@@ -154,16 +188,15 @@ def get_data(n_clicks,stock, obs, lookback, forward):
     ]
 )
 def chart(data, stock):
-    data = json.loads(data)
-    tempdata = pd.DataFrame(json.loads(data['data']))
-    tempdata['date'] = pd.to_datetime(tempdata['date'])
+    data = load_result(data)
+    dates = pd.DatetimeIndex(data['date'])
     forward_dates = pd.bdate_range(
-            tempdata['date'].max() + BDay(1) ,
-            tempdata['date'].max() + BDay(len(data['forwardSimulationMean']))
+            dates.max() + BDay(1) ,
+            dates.max() + BDay(len(data['forwardSimulationMean']))
     )
     line = go.Scatter(
-        x = tempdata['date'],
-        y = tempdata['adj_close'],
+        x = dates,
+        y = data['adj_close'],
         name = stock + ' Adjusted Close Price'
     )
     average = go.Scatter(
@@ -182,11 +215,11 @@ def chart(data, stock):
         name = 'Simulation Upper Bound'
     )
 
-    line_candle = go.Candlestick(x = tempdata['date'],
-                          open=tempdata['adj_open'],
-                          close = tempdata['adj_close'],
-                          low=tempdata['adj_low'],
-                          high=tempdata['adj_high'],
+    line_candle = go.Candlestick(x = dates,
+                          open=data['adj_open'],
+                          close = data['adj_close'],
+                          low=data['adj_low'],
+                          high=data['adj_high'],
                           increasing=dict(
                               line=dict(
                                   color='black'
@@ -268,25 +301,21 @@ def chart(data, stock):
     ]
 )
 def monte_carlo_histogram(simdata, forward):
-    simdata = json.loads(simdata)
-    tempdata = pd.DataFrame(json.loads(simdata['data']))
-    fig_data = [
-        go.Histogram(
-            x=simdata['dist'],
-            histnorm='probability',
-            opacity=.75,
-            name='MC {}D Simulation'.format(forward)
-        )
-    ]
-    fig_data.append(
-        go.Histogram(
-            x = tempdata['percentchange'].rolling(forward).sum() * simdata['currentprice'],
-            histnorm='probability',
-            opacity=.75,
-            name='Historic {}D Distribution'.format(forward)
+    simdata = load_result(simdata)
+    # Bars are drawn from the stored bin counts, so the figure size does not grow with the number of paths
+    fig_data = []
+    for prefix, name in [('sim', 'MC {}D Simulation'), ('hist', 'Historic {}D Distribution')]:
+        edges = simdata[prefix + '_bin_edges'] * simdata['currentprice']
+        fig_data.append(
+            go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=simdata[prefix + '_probabilities'],
+                width=np.diff(edges),
+                opacity=.75,
+                name=name.format(forward)
+            )
         )
-    )
-    layout = go.Layout(barmode='overlay')
+    layout = go.Layout(barmode='overlay', bargap=0)
     fig = go.Figure(data=fig_data, layout=layout)
     return fig
 
@@ -295,12 +324,13 @@ def monte_carlo_histogram(simdata, forward):
               [Input('querydata', 'children'),
                Input('periods_forward', 'value')])
 def summary_table(sim, forward):
-    simdata = json.loads(sim)
-    var = np.nanpercentile(simdata['dist'], 2.5)
+    simdata = load_result(sim)
+    # Both VaR rows use the control variate estimate, the summary quantiles are unweighted
     percentvar = simdata['percentVaR']
+    var = percentvar * simdata['currentprice']
     percentvol = simdata['currentvol'] * 2
-    actvar = np.nanpercentile(simdata['hist_dist'], 2.5)
-    simvol = np.nanstd(simdata['dist'])
+    actvar = summary_quantile(simdata, 'daily', 2.5) * simdata['currentprice']
+    simvol = simdata['sim_std'] * simdata['currentprice']
     exvol = simdata['currentexvol']
     swvol = simdata['currentswvol']
     exreturn = simdata['currentswr']
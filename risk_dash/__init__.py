@@ -1,2 +1,2 @@
 name = 'risk_dash'
-from . import market_data, securities, simgen
+from . import market_data, securities, simgen, rolling, backtest, stress, pricing, results
@@ -0,0 +1,236 @@
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+from scipy.special import xlogy
+from scipy.stats import chi2
+
+from . import simgen as mc
+from .rolling import RollingRiskEngine
+
+
+def kupiec(breaches, probability):
+    """
+    Kupiec proportion of failures test, whether the breach rate matches the VaR probability
+
+    :param breaches: list-like bool, True where the realized return fell below the VaR forecast
+    :param probability: float, the VaR probability, e.g. 0.025
+
+    :return: tuple, (float likelihood ratio, float p-value from a chi-squared with 1 degree of freedom)
+    """
+    breaches = np.asarray(breaches, dtype=bool)
+    observations = len(breaches)
+    failures = breaches.sum()
+    rate = failures / observations
+    ratio = -2 * (
+        xlogy(observations - failures, 1 - probability) + xlogy(failures, probability)
+        - xlogy(observations - failures, 1 - rate) - xlogy(failures, rate)
+    )
+    return ratio, chi2.sf(ratio, 1)
+
+
+def christoffersen(breaches):
+    """
+    Christoffersen independence test, whether a breach makes a breach on the next date more likely
+
+    :param breaches: list-like bool, True where the realized return fell below the VaR forecast
+
+    :return: tuple, (float likelihood ratio, float p-value from a chi-squared with 1 degree of freedom)
+    """
+    breaches = np.asarray(breaches, dtype=bool)
+    previous, current = breaches[:-1], breaches[1:]
+    n00 = np.sum(~previous & ~current)
+    n01 = np.sum(~previous & current)
+    n10 = np.sum(previous & ~current)
+    n11 = np.sum(previous & current)
+    pi0 = n01 / max(n00 + n01, 1)
+    pi1 = n11 / max(n10 + n11, 1)
+    pi = (n01 + n11) / max(n00 + n01 + n10 + n11, 1)
+    ratio = -2 * (
+        xlogy(n00 + n10, 1 - pi) + xlogy(n01 + n11, pi)
+        - xlogy(n00, 1 - pi0) - xlogy(n01, pi0) - xlogy(n10, 1 - pi1) - xlogy(n11, pi1)
+    )
+    return ratio, chi2.sf(ratio, 1)
+
+
+def normal_simulation(window):
+    """
+    Default simulation for VaRBacktest.simulation, a NaiveMonteCarlo of normal steps fitted to the window's mean and standard deviation
+
+    :param window: numpy.array, the portfolio log returns in the window
+
+    :return: simgen.NaiveMonteCarlo
+    """
+    return mc.NaiveMonteCarlo(mc.NormalDistribution(window.mean(), window.std(ddof=1)))
+
+
+def simulate_dates(history, window, var_horizon, number_of_simulations, confidence, factory, seeds):
+    """
+    Function to compute simulated VaR for a block of consecutive dates. Defined at module level so it can be sent to a process pool
+
+    :param history: numpy.array, portfolio log returns from window - 1 observations before the first date to the last date of the block
+    :param window: int, number of observations each simulation is fitted to
+    :param var_horizon: int, how many steps each path takes
+    :param number_of_simulations: int, how many paths are simulated at each date
+    :param confidence: float, VaR percentile in percentage
+    :param factory: callable, takes the window of returns and returns a simgen._Simulation
+    :param seeds: list of numpy.random.SeedSequence, one per date
+
+    :return: numpy.array of shape (dates,), the simulated VaR as a return
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(history, window)
+    output = np.empty(len(windows))
+    for i, (observations, seed) in enumerate(zip(windows, seeds)):
+        simulation = factory(observations)
+        paths = simulation.generate_paths(var_horizon, number_of_simulations, random_state=np.random.default_rng(seed))
+        output[i] = np.exp(np.percentile(paths[:, -1], confidence)) - 1
+    return output
+
+
+class VaRBacktest(object):
+    """
+    Walk-forward VaR backtest over a history of log returns. At each date a model forecasts VaR from the window ending on that date, and the forecast is compared to the portfolio return over the following var_horizon dates
+
+    With var_horizon above 1 the realized windows overlap, so breaches on neighbouring dates are not independent and the Christoffersen test should be read with care
+
+    :param returns: numpy.array of shape (dates, assets), log returns, such as Portfolio.get_portfolio_panel('percentchange').values
+    :param weights: numpy.array of shape (assets,), the portfolio weight of each column
+    :param index: list-like or None, the dates of returns
+    :param window: int, default 250, number of observations each forecast uses
+    :param var_horizon: int, default 1, how many days/periods forward VaR is forecast and realized
+    :param confidence: float, default 2.5, VaR percentile in percentage
+    """
+
+    def __init__(self, returns, weights, index=None, window=250, var_horizon=1, confidence=2.5):
+        self.returns = np.asarray(returns, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.index = index if index is not None else pd.RangeIndex(len(self.returns))
+        self.window = window
+        self.var_horizon = var_horizon
+        self.confidence = confidence
+        self.portfolio = self.returns @ self.weights
+
+    def realized(self):
+        """
+        Portfolio return over the var_horizon dates after each date, NaN where the history ends first
+
+        :return: numpy.array of shape (dates,)
+        """
+        cumulative = np.concatenate([[0], np.cumsum(self.portfolio)])
+        output = np.full(len(self.portfolio), np.nan)
+        horizon = self.var_horizon
+        output[:len(output) - horizon] = cumulative[1 + horizon:] - cumulative[1:-horizon]
+        return np.exp(output) - 1
+
+    def parametric(self, ewma=False, decay=0.94):
+        """
+        Parametric VaR forecasts from the incrementally updated rolling or EWMA covariance, see rolling.RollingRiskEngine
+
+        :param ewma: bool, if True use the EWMA covariance rather than the rolling window
+        :param decay: float, EWMA decay
+
+        :return: numpy.array of shape (dates,)
+        """
+        engine = RollingRiskEngine(self.returns, self.weights, self.window, decay, self.confidence, self.var_horizon)
+        output = engine.run()
+        return output['ewma_value_at_risk' if ewma else 'value_at_risk']
+
+    def historic(self):
+        """
+        Historic VaR forecasts, the percentile of the var_horizon portfolio returns in each window
+
+        :return: numpy.array of shape (dates,)
+        """
+        engine = RollingRiskEngine(self.returns, self.weights, self.window, confidence=self.confidence, var_horizon=self.var_horizon)
+        return engine.historic_value_at_risk()
+
+    def simulation(self, number_of_simulations=10000, factory=normal_simulation, executor=None, block_size=250, seed=None):
+        """
+        Simulated VaR forecasts, refitting a simulation to the window at every date. Dates are split into blocks that can be spread across a concurrent.futures.Executor, such as a ProcessPoolExecutor. Every date draws from its own numpy.random.Generator spawned from one numpy.random.SeedSequence, so a fixed seed gives identical results for any number of workers
+
+        :param number_of_simulations: int, how many paths are simulated at each date
+        :param factory: callable, takes the window of portfolio log returns and returns a simgen._Simulation, must be defined at module level to be used with a process pool
+        :param executor: concurrent.futures.Executor or None, if set, date blocks are run with executor.map
+        :param block_size: int, number of dates per block
+        :param seed: int, numpy.random.SeedSequence or None, master seed for the per date Generators
+
+        :return: numpy.array of shape (dates,)
+        """
+        output = np.full(len(self.portfolio), np.nan)
+        first = self.window - 1
+        dates = len(self.portfolio) - first
+        if dates <= 0:
+            return output
+        seeds = np.random.SeedSequence(seed).spawn(dates)
+        starts = range(first, len(self.portfolio), block_size)
+        histories = [self.portfolio[start - first:start + block_size] for start in starts]
+        blocks = [seeds[start - first:start - first + block_size] for start in starts]
+        arguments = (
+            histories,
+            repeat(self.window),
+            repeat(self.var_horizon),
+            repeat(number_of_simulations),
+            repeat(self.confidence),
+            repeat(factory),
+            blocks
+        )
+        if executor is None:
+            results = map(simulate_dates, *arguments)
+        else:
+            results = executor.map(simulate_dates, *arguments)
+        output[first:] = np.concatenate(list(results))
+        return output
+
+    def evaluate(self, forecast):
+        """
+        Compare VaR forecasts to realized returns, recording breaches and coverage statistics. Dates without a forecast or a realized return are dropped
+
+        :param forecast: list-like float of shape (dates,), the VaR forecast at each date as a return
+
+        :return: tuple, (DataFrame of forecast, realized and breach indexed by date, dict of statistics)
+        """
+        results = pd.DataFrame({
+            'forecast': np.asarray(forecast, dtype=float),
+            'realized': self.realized()
+        }, index=self.index).dropna()
+        results['breach'] = results['realized'].values < results['forecast'].values
+        breaches = results['breach'].values
+        probability = self.confidence / 100
+        kupiec_ratio, kupiec_p = kupiec(breaches, probability)
+        independence_ratio, independence_p = christoffersen(breaches)
+        statistics = {
+            'observations': len(breaches),
+            'breaches': int(breaches.sum()),
+            'expected_breaches': len(breaches) * probability,
+            'breach_rate': breaches.mean() if len(breaches) else np.nan,
+            'kupiec': kupiec_ratio,
+            'kupiec_pvalue': kupiec_p,
+            'christoffersen': independence_ratio,
+            'christoffersen_pvalue': independence_p,
+            'conditional_coverage': kupiec_ratio + independence_ratio,
+            'conditional_coverage_pvalue': chi2.sf(kupiec_ratio + independence_ratio, 2)
+        }
+        self.results = results
+        self.statistics = statistics
+        return results, statistics
+
+    def run(self, model='parametric', **kwargs):
+        """
+        Forecast with one model and evaluate it
+
+        :param model: string, one of 'parametric', 'ewma', 'historic' or 'simulation'
+        :param kwargs: passed to the model method, such as decay or number_of_simulations, executor and seed
+
+        :return: tuple, (DataFrame of forecast, realized and breach indexed by date, dict of statistics)
+        """
+        if model == 'parametric':
+            forecast = self.parametric(**kwargs)
+        elif model == 'ewma':
+            forecast = self.parametric(ewma=True, **kwargs)
+        elif model == 'historic':
+            forecast = self.historic()
+        elif model == 'simulation':
+            forecast = self.simulation(**kwargs)
+        else:
+            raise Exception('model must be one of parametric, ewma, historic or simulation')
+        return self.evaluate(forecast)
@@ -1,9 +1,27 @@
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import quandl
 import requests
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 import numpy as np
 
+try:
+    import fcntl
+except ImportError:
+    # Windows, index updates are only serialized within a process
+    fcntl = None
+
+# Feather is used when pyarrow is installed, otherwise cached frames fall back to pickle
+CACHE_FORMAT = 'feather' if importlib.util.find_spec('pyarrow') is not None else 'pickle'
+
 
 class _MarketData(object):
     """
@@ -41,46 +59,251 @@ class _MarketData(object):
     def set_expected(self, days):
         raise NotImplementedError
 
+    def refresh(self):
+        """
+        This should fetch only the data newer than what is held and update market_data and its derived values in place
+
+        :return: int, number of new rows
 
-class QuandlStockData(_MarketData):
+        """
+        raise NotImplementedError
+
+
+class MarketDataCache(object):
     """
-    _MarketData class for Quandl's WIKI/EOD price data base (https://www.quandl.com/databases/WIKIP)
+    Local on-disk cache of raw market data frames, keyed by ticker and date range. Frames are stored in a columnar format and tracked in an index file, so repeated loads of the same ticker skip the network
 
-    :param apikey: string, a valid Quandl apikey
-    :param ticker: string, ticker symbol to query
-    :param days: int, how many days back to use for rolling metrics
+    :param directory: string, folder to store cached frames in
+    :param ttl: float or None, seconds an entry is served before it is refetched, None never expires
+    :param max_bytes: int or None, total size of cached files, least recently used entries are evicted past it
+    :param offline: bool, if True only serve from the cache, regardless of ttl, and never fetch from the source
     """
 
-    def __init__(self, apikey, ticker, days=80):
+    def __init__(self, directory='.market_data_cache', ttl=24 * 60 * 60, max_bytes=512 * 2 ** 20, offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock = threading.Lock()
 
-        self.apikey = apikey
-        self.ticker = ticker
-        self.market_data = self.gather()
-        self.market_data.index = self.market_data['date']
-        self.market_data = self.market_data.sort_index()
-        self.maxdate = max(self.market_data['date'])
-        self.set_volatility(days)
-        self.set_expected(days)
+    def read_index(self):
+        """
+        Returns the cache index, a dict of entry key to ticker, start, end, file, size, fetched and accessed times
 
+        :return: dict
+        """
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
 
-    def gather(self):
+    def write_index(self, index):
         """
-        Gathers the data from the Quandl api and returns a pandas DataFrame
+        Atomically replace the cache index
 
-        :return: pandas DataFrame
+        :param index: dict, the cache index
+        """
+        temp_path = self.temp_path()
+        with open(temp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp_path, self.index_path)
 
+    def temp_path(self):
         """
-        quandl.ApiConfig.api_key = self.apikey
-        # this would be where I would construct it's own api call, using quandl's get_table method instead
-        #base = quandl.ApiConfig.api_base
-        #base += '/datatables/' + querypattern + '&api_key=' + apikey
-        #data = requests.get(base)
-        metadata = quandl.Dataset('WIKI/' + self.ticker)
-        date = metadata['newest_available_date']
-        data = quandl.get_table('WIKI/PRICES',
-                                ticker=self.ticker,
-                                date={'gte':(date - relativedelta(years=5))})
-        return(data)
+        Helper function to create a uniquely named temporary file in the cache directory, so concurrent writers in any thread or process never share one
+
+        :return: string, path of the empty file
+        """
+        handle, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(handle)
+        return path
+
+    @contextmanager
+    def index_lock(self):
+        """
+        Context manager that serializes read-modify-write updates of the index across threads, and across processes through a lock file where fcntl is available
+        """
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.index_path + '.lock', 'w') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def entry_key(ticker, start, end):
+        """
+        Returns the index key of a ticker and date range
+
+        :param ticker: string, ticker symbol
+        :param start: date-like, first date of the range
+        :param end: date-like, last date of the range
+
+        :return: string
+        """
+        return '{}_{:%Y%m%d}_{:%Y%m%d}'.format(ticker, pd.Timestamp(start), pd.Timestamp(end))
+
+    def get(self, ticker, start=None, end=None):
+        """
+        Returns the most recently fetched cached frame for ticker that covers start to end, if start or end is None any range matches
+
+        :param ticker: string, ticker symbol
+        :param start: date-like or None, first date needed
+        :param end: date-like or None, last date needed
+
+        :return: pandas DataFrame or None if there is no usable entry
+        """
+        index = self.read_index()
+        now = time.time()
+        candidates = [
+            (name, entry) for name, entry in index.items()
+            if entry['ticker'] == ticker
+            and (start is None or pd.Timestamp(entry['start']) <= pd.Timestamp(start))
+            and (end is None or pd.Timestamp(entry['end']) >= pd.Timestamp(end))
+            and (self.offline or self.ttl is None or now - entry['fetched'] <= self.ttl)
+        ]
+        for name, entry in sorted(candidates, key=lambda item: item[1]['fetched'], reverse=True):
+            path = os.path.join(self.directory, entry['file'])
+            try:
+                if entry['file'].endswith('.feather'):
+                    data = pd.read_feather(path)
+                else:
+                    data = pd.read_pickle(path)
+            except (FileNotFoundError, OSError):
+                continue
+            # Mark the file as recently used for eviction instead of rewriting the index on every hit
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return data
+        if self.offline:
+            raise Exception('No cached market data for {} in offline mode'.format(ticker))
+        return None
+
+    def put(self, ticker, data, start, end):
+        """
+        Store a raw market data frame and evict entries past max_bytes
+
+        :param ticker: string, ticker symbol
+        :param data: pandas DataFrame, the raw frame returned by the source
+        :param start: date-like, first date of the range
+        :param end: date-like, last date of the range
+        """
+        name = self.entry_key(ticker, start, end)
+        file_name = name + ('.feather' if CACHE_FORMAT == 'feather' else '.pkl')
+        path = os.path.join(self.directory, file_name)
+        temp_path = self.temp_path()
+        if CACHE_FORMAT == 'feather':
+            data.reset_index(drop=True).to_feather(temp_path)
+        else:
+            data.to_pickle(temp_path)
+        os.replace(temp_path, path)
+
+        with self.index_lock():
+            index = self.read_index()
+            now = time.time()
+            index[name] = {
+                'ticker': ticker,
+                'start': str(pd.Timestamp(start).date()),
+                'end': str(pd.Timestamp(end).date()),
+                'file': file_name,
+                'size': os.path.getsize(path),
+                'fetched': now,
+                'accessed': now
+            }
+            self.write_index(self.evict(index))
+
+    def accessed(self, entry):
+        """
+        Helper function to return when an entry was last used, its file modification time, or the stored time if the file is missing
+
+        :param entry: dict, an entry of the cache index
+
+        :return: float
+        """
+        try:
+            return os.path.getmtime(os.path.join(self.directory, entry['file']))
+        except OSError:
+            return entry['accessed']
+
+    def evict(self, index):
+        """
+        Remove expired entries and least recently used entries until the cache fits in max_bytes. Use is tracked by file modification time, which .get updates on every hit
+
+        :param index: dict, the cache index
+
+        :return: dict, the index without the evicted entries
+        """
+        now = time.time()
+        by_access = sorted(index.items(), key=lambda item: self.accessed(item[1]))
+        total = sum(entry['size'] for name, entry in by_access)
+        for name, entry in by_access:
+            expired = self.ttl is not None and not self.offline and now - entry['fetched'] > self.ttl
+            if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                continue
+            try:
+                os.remove(os.path.join(self.directory, entry['file']))
+            except FileNotFoundError:
+                pass
+            total -= entry['size']
+            index.pop(name)
+        return index
+
+    def clear(self):
+        """
+        Remove every cached entry
+        """
+        with self.index_lock():
+            for entry in self.read_index().values():
+                try:
+                    os.remove(os.path.join(self.directory, entry['file']))
+                except FileNotFoundError:
+                    pass
+            self.write_index({})
+
+
+class _StockData(_MarketData):
+    """
+    Shared implementation for daily stock price data, any subclass whose .gather returns a pandas DataFrame with date and adj_close columns gets the derived market_data columns, current values and incremental appends
+    """
+
+    cache = None
+
+    # Incremented whenever market_data changes, so dependent calculations can tell when to recompute
+    version = 0
+
+    # Columns whose latest values are kept in .snapshot
+    SNAPSHOT_COLUMNS = (
+        'adj_close',
+        'percentchange',
+        'exp_volatility',
+        'sw_volatility',
+        'exp_average_dailyincrease',
+        'sw_average_dailyincrease'
+    )
+
+    def set_market_data(self, data, days):
+        """
+        Index raw data by date and compute the derived columns
+
+        :param data: pandas DataFrame, raw data with date and adj_close columns
+        :param days: int, how many days back to use for rolling metrics
+
+        """
+        self.market_data = data
+        self.market_data.index = self.market_data['date']
+        self.market_data = self.market_data.sort_index()
+        self.maxdate = max(self.market_data['date'])
+        self.set_volatility(days)
+        self.set_expected(days)
 
     def set_price_changes(self):
         """
@@ -100,8 +323,9 @@ class QuandlStockData(_MarketData):
         self.set_price_changes()
         self.market_data['exp_volatility'] = self.market_data['percentchange'].ewm(span=days,min_periods=days).std()
         self.market_data['sw_volatility'] = self.market_data['percentchange'].rolling(days).std()
-        self.currentexvol = self.market_data.loc[self.market_data['date']==self.maxdate, 'exp_volatility'].values[0]
-        self.currentswvol = self.market_data.loc[self.market_data['date']==self.maxdate, 'sw_volatility'].values[0]
+        self.days = days
+        self.set_ewm_state(days)
+        self.set_snapshot()
 
     def set_expected(self, days):
         """
@@ -112,8 +336,111 @@ class QuandlStockData(_MarketData):
         """
         self.market_data['exp_average_dailyincrease'] = self.market_data['percentchange'].ewm(span=days, min_periods=days).mean()
         self.market_data['sw_average_dailyincrease'] = self.market_data['percentchange'].rolling(days).mean()
-        self.currentexmean = self.market_data.loc[self.market_data['date']==self.maxdate, 'exp_average_dailyincrease'].values[0]
-        self.currentswmean = self.market_data.loc[self.market_data['date']==self.maxdate, 'sw_average_dailyincrease'].values[0]
+        self.set_snapshot()
+
+    def set_snapshot(self):
+        """
+        Store the values of the latest row, market_data is sorted by date so this is the last position, along with the currentexvol, currentswvol, currentexmean and currentswmean attributes. Called whenever market_data changes so current values are plain lookups
+        """
+        self.version += 1
+        self.snapshot = {
+            column: self.market_data[column].values[-1]
+            for column in self.SNAPSHOT_COLUMNS
+            if column in self.market_data.columns
+        }
+        self.currentexvol = self.snapshot.get('exp_volatility')
+        self.currentswvol = self.snapshot.get('sw_volatility')
+        self.currentexmean = self.snapshot.get('exp_average_dailyincrease')
+        self.currentswmean = self.snapshot.get('sw_average_dailyincrease')
+
+    def set_ewm_state(self, days):
+        """
+        Store the state of the exponentially weighted mean and variance of percentchange at the last row, so new rows can be added without revisiting the history. Mirrors pandas' ewm with adjust=True
+
+        :param days: int, span of the exponentially weighted window
+
+        """
+        values = self.market_data['percentchange'].values
+        decay = 1 - 2 / (days + 1)
+        weights = np.power(decay, np.arange(len(values) - 1, -1, -1))
+        weight = weights.sum()
+        mean = np.dot(weights, values) / weight
+        self.ewm_state = {
+            'decay': decay,
+            'weight': weight,
+            'weight_sq': np.square(weights).sum(),
+            'mean': mean,
+            'cov': np.dot(weights, np.square(values - mean)) / weight,
+            'nobs': len(values)
+        }
+
+    def update_ewm_state(self, values):
+        """
+        Advance the exponentially weighted state through new percentchange values
+
+        :param values: list-like float, new percentchange values in date order
+
+        :return: tuple, (np.array exponentially weighted means, np.array exponentially weighted standard deviations) at each new value
+        """
+        state = self.ewm_state
+        decay = state['decay']
+        means = np.empty(len(values))
+        stds = np.empty(len(values))
+        for i, value in enumerate(values):
+            state['weight'] *= decay
+            state['weight_sq'] *= decay ** 2
+            old_mean = state['mean']
+            state['mean'] = (state['weight'] * old_mean + value) / (state['weight'] + 1)
+            state['cov'] = (
+                state['weight'] * (state['cov'] + (old_mean - state['mean']) ** 2)
+                + (value - state['mean']) ** 2
+            ) / (state['weight'] + 1)
+            state['weight'] += 1
+            state['weight_sq'] += 1
+            state['nobs'] += 1
+            numerator = state['weight'] ** 2
+            denominator = numerator - state['weight_sq']
+            if state['nobs'] >= self.days:
+                means[i] = state['mean']
+                stds[i] = np.sqrt(numerator / denominator * state['cov']) if denominator > 0 else np.nan
+            else:
+                means[i] = np.nan
+                stds[i] = np.nan
+        return means, stds
+
+    def append_market_data(self, new_data):
+        """
+        Append rows newer than maxdate to market_data and compute the derived columns for those rows only. Exponentially weighted values continue from the stored state and rolling values only look at the last days rows
+
+        :param new_data: pandas DataFrame, raw rows in the same format returned by .gather
+
+        :return: int, number of new rows
+
+        """
+        new_data = new_data.loc[new_data['date'] > self.maxdate].copy()
+        if len(new_data) == 0:
+            return 0
+        new_data.index = new_data['date']
+        new_data = new_data.sort_index()
+
+        closes = np.concatenate([[self.market_data['adj_close'].values[-1]], new_data['adj_close'].values])
+        new_data['pricechange'] = np.diff(closes)
+        new_data['percentchange'] = np.diff(np.log(closes))
+
+        new_data['exp_average_dailyincrease'], new_data['exp_volatility'] = self.update_ewm_state(new_data['percentchange'].values)
+        window = pd.concat([
+            self.market_data['percentchange'].iloc[max(len(self.market_data) - self.days + 1, 0):],
+            new_data['percentchange']
+        ]).rolling(self.days)
+        new_data['sw_volatility'] = window.std().values[-len(new_data):]
+        new_data['sw_average_dailyincrease'] = window.mean().values[-len(new_data):]
+
+        self.market_data = pd.concat([self.market_data, new_data])
+        self.maxdate = max(new_data['date'])
+        self.set_snapshot()
+        if self.cache is not None:
+            self.cache.put(self.ticker, self.market_data.reset_index(drop=True), min(self.market_data['date']), self.maxdate)
+        return len(new_data)
 
     def current_price(self):
         """
@@ -122,8 +449,287 @@ class QuandlStockData(_MarketData):
         :return: float, latest available market price
 
         """
-        return(self.market_data.loc[self.market_data['date']==self.maxdate, 'adj_close'].values[0])
+        return(self.snapshot['adj_close'])
 
 
+class QuandlStockData(_StockData):
+    """
+    _MarketData class for Quandl's WIKI/EOD price data base (https://www.quandl.com/databases/WIKIP)
 
+    :param apikey: string, a valid Quandl apikey
+    :param ticker: string, ticker symbol to query
+    :param days: int, how many days back to use for rolling metrics
+    :param cache: MarketDataCache or None, local cache to serve and store the raw data
+    :param data: pandas DataFrame or None, raw data already gathered, for example by load_bulk, used instead of calling .gather
+    """
+
+    def __init__(self, apikey, ticker, days=80, cache=None, data=None):
+
+        self.apikey = apikey
+        self.ticker = ticker
+        self.cache = cache
+        self.days = days
+        self.set_market_data(self.gather() if data is None else data, days)
+
+    def gather(self):
+        """
+        Gathers the data from the cache, if set and holding a fresh entry, otherwise from the Quandl api, and returns a pandas DataFrame
+
+        :return: pandas DataFrame
 
+        """
+        if self.cache is not None:
+            data = self.cache.get(self.ticker)
+            if data is not None:
+                return(data)
+        quandl.ApiConfig.api_key = self.apikey
+        # this would be where I would construct it's own api call, using quandl's get_table method instead
+        #base = quandl.ApiConfig.api_base
+        #base += '/datatables/' + querypattern + '&api_key=' + apikey
+        #data = requests.get(base)
+        metadata = quandl.Dataset('WIKI/' + self.ticker)
+        date = metadata['newest_available_date']
+        data = quandl.get_table('WIKI/PRICES',
+                                ticker=self.ticker,
+                                date={'gte':(date - relativedelta(years=5))})
+        if self.cache is not None:
+            self.cache.put(self.ticker, data, date - relativedelta(years=5), date)
+        return(data)
+
+    def refresh(self):
+        """
+        Fetch only the rows after maxdate from the Quandl api and append them to market_data, see .append_market_data
+
+        :return: int, number of new rows
+
+        """
+        quandl.ApiConfig.api_key = self.apikey
+        new_data = quandl.get_table('WIKI/PRICES',
+                                    ticker=self.ticker,
+                                    date={'gt': self.maxdate.strftime('%Y-%m-%d')})
+        return self.append_market_data(new_data)
+
+
+class LocalStockData(_StockData):
+    """
+    _MarketData class for price data stored in local files, a stand-in for QuandlStockData that needs no network. Files hold the WIKI/PRICES columns, at least date and adj_close, as CSV, Parquet, Feather or a NumPy structured array (.npy) that is memory-mapped when read
+
+    :param path: string, path to a file, or to a directory holding one <ticker>.<extension> file per ticker, such as one written by generate_synthetic_market_data
+    :param ticker: string or None, ticker symbol, required when path is a directory, otherwise taken from the file name if None
+    :param days: int, how many days back to use for rolling metrics
+    :param file_format: string or None, one of LocalStockData.FILE_FORMATS, inferred from the path if None
+    """
+
+    FILE_FORMATS = ('npy', 'parquet', 'feather', 'csv')
+
+    def __init__(self, path, ticker=None, days=80, file_format=None):
+
+        if os.path.isdir(path):
+            if file_format is None:
+                file_format = next(
+                    (extension for extension in self.FILE_FORMATS
+                     if os.path.exists(os.path.join(path, '{}.{}'.format(ticker, extension)))),
+                    None
+                )
+            path = os.path.join(path, '{}.{}'.format(ticker, file_format))
+        self.path = path
+        self.ticker = ticker if ticker is not None else os.path.splitext(os.path.basename(path))[0]
+        self.file_format = file_format if file_format is not None else os.path.splitext(path)[1].lstrip('.')
+        self.days = days
+        self.set_market_data(self.gather(), days)
+
+    def gather(self):
+        """
+        Reads the data from the local file and returns a pandas DataFrame
+
+        :return: pandas DataFrame
+
+        """
+        if self.file_format == 'npy':
+            records = np.load(self.path, mmap_mode='r')
+            data = pd.DataFrame({name: records[name] for name in records.dtype.names})
+        elif self.file_format == 'parquet':
+            data = pd.read_parquet(self.path)
+        elif self.file_format == 'feather':
+            data = pd.read_feather(self.path)
+        elif self.file_format == 'csv':
+            data = pd.read_csv(self.path, parse_dates=['date'])
+        else:
+            raise Exception('File format must be one of ' + ', '.join(self.FILE_FORMATS))
+        return(data)
+
+    def refresh(self):
+        """
+        Re-read the local file and append the rows after maxdate, see .append_market_data
+
+        :return: int, number of new rows
+
+        """
+        return self.append_market_data(self.gather())
+
+
+def generate_synthetic_market_data(tickers, years=20, start='2000-01-03', directory=None, file_format='npy', seed=None, drift=0.0003, volatility=0.02, correlation=0.3, block_size=256):
+    """
+    Generate synthetic daily price histories in the WIKI/PRICES layout for stress testing without the network. Log returns share one market factor, so tickers are correlated, and are generated as (dates, tickers) arrays in blocks of tickers
+
+    :param tickers: int or list-like string, ticker symbols, or how many tickers to name SYN00000, SYN00001, ...
+    :param years: float, default 20, length of each history in years of 252 business days
+    :param start: date-like, first business day of the histories
+    :param directory: string or None, if set, one <ticker>.<file_format> file per ticker is written there for LocalStockData
+    :param file_format: string, one of LocalStockData.FILE_FORMATS
+    :param seed: int or None, seed for reproducible histories
+    :param drift: float, average daily log return
+    :param volatility: float, average daily volatility, each ticker's is drawn between half and double this
+    :param correlation: float, share of each ticker's variance explained by the market factor
+    :param block_size: int, default 256, how many tickers are generated at once
+
+    :return: dict of ticker to pandas DataFrame if directory is None, otherwise dict of ticker to file path
+    """
+    if isinstance(tickers, int):
+        tickers = ['SYN{:05d}'.format(i) for i in range(tickers)]
+    tickers = list(tickers)
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=int(years * 252))
+    market = rng.standard_normal(len(dates))
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+
+    output = {}
+    for block_start in range(0, len(tickers), block_size):
+        block = tickers[block_start:block_start + block_size]
+        vols = volatility * rng.uniform(0.5, 2.0, len(block))
+        shocks = np.sqrt(correlation) * market[:, None] + np.sqrt(1 - correlation) * rng.standard_normal((len(dates), len(block)))
+        returns = drift + vols * shocks
+        closes = rng.uniform(10, 500, len(block)) * np.exp(np.cumsum(returns, axis=0))
+        opens = np.vstack([closes[:1], closes[:-1]]) * np.exp(vols * 0.25 * rng.standard_normal(closes.shape))
+        highs = np.maximum(opens, closes) * np.exp(np.abs(vols * 0.5 * rng.standard_normal(closes.shape)))
+        lows = np.minimum(opens, closes) * np.exp(-np.abs(vols * 0.5 * rng.standard_normal(closes.shape)))
+        volumes = np.round(rng.lognormal(13, 1, closes.shape))
+
+        for j, ticker in enumerate(block):
+            data = pd.DataFrame({
+                'ticker': ticker,
+                'date': dates,
+                'open': opens[:, j],
+                'high': highs[:, j],
+                'low': lows[:, j],
+                'close': closes[:, j],
+                'volume': volumes[:, j],
+                'ex-dividend': 0.0,
+                'split_ratio': 1.0,
+                'adj_open': opens[:, j],
+                'adj_high': highs[:, j],
+                'adj_low': lows[:, j],
+                'adj_close': closes[:, j],
+                'adj_volume': volumes[:, j]
+            })
+            if directory is None:
+                output[ticker] = data
+                continue
+            path = os.path.join(directory, '{}.{}'.format(ticker, file_format))
+            if file_format == 'npy':
+                np.save(path, data.to_records(index=False, column_dtypes={'ticker': 'U16'}))
+            elif file_format == 'parquet':
+                data.to_parquet(path)
+            elif file_format == 'feather':
+                data.to_feather(path)
+            elif file_format == 'csv':
+                data.to_csv(path, index=False)
+            else:
+                raise Exception('File format must be one of ' + ', '.join(LocalStockData.FILE_FORMATS))
+            output[ticker] = path
+    return output
+
+
+def load_bulk(apikey, tickers, days=80, cache=None, max_workers=8, batch_size=50):
+    """
+    Load QuandlStockData for many tickers at once. Duplicate tickers are loaded once, cached tickers are served from the cache, and the rest are fetched concurrently on a bounded thread pool, with tickers sharing a date window requested together in one multi-ticker table query
+
+    :param apikey: string, a valid Quandl apikey
+    :param tickers: list-like string, ticker symbols to load
+    :param days: int, how many days back to use for rolling metrics
+    :param cache: MarketDataCache or None, local cache to serve and store the raw data
+    :param max_workers: int, default 8, maximum number of concurrent requests
+    :param batch_size: int, default 50, maximum number of tickers per table query
+
+    :return: tuple, (dict of ticker to QuandlStockData for every ticker that loaded, pandas DataFrame report with the source, seconds taken and error for each ticker)
+    """
+    quandl.ApiConfig.api_key = apikey
+    tickers = list(dict.fromkeys(tickers))
+    raw = {}
+    report = {ticker: {'source': None, 'seconds': 0.0, 'error': None} for ticker in tickers}
+
+    to_fetch = []
+    for ticker in tickers:
+        start_time = time.perf_counter()
+        try:
+            data = cache.get(ticker) if cache is not None else None
+        except Exception as e:
+            report[ticker]['error'] = str(e)
+            continue
+        report[ticker]['seconds'] += time.perf_counter() - start_time
+        if data is not None:
+            raw[ticker] = data
+            report[ticker]['source'] = 'cache'
+        else:
+            to_fetch.append(ticker)
+
+    def newest_date(ticker):
+        start_time = time.perf_counter()
+        try:
+            return ticker, quandl.Dataset('WIKI/' + ticker)['newest_available_date'], None, time.perf_counter() - start_time
+        except Exception as e:
+            return ticker, None, str(e), time.perf_counter() - start_time
+
+    def fetch_batch(batch):
+        start_time = time.perf_counter()
+        end, batch_tickers = batch
+        try:
+            data = quandl.get_table('WIKI/PRICES',
+                                    ticker=batch_tickers,
+                                    date={'gte': (end - relativedelta(years=5))},
+                                    paginate=True)
+            return batch, data, None, time.perf_counter() - start_time
+        except Exception as e:
+            return batch, None, str(e), time.perf_counter() - start_time
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        windows = {}
+        for ticker, end, error, seconds in executor.map(newest_date, to_fetch):
+            report[ticker]['seconds'] += seconds
+            if error is not None:
+                report[ticker]['error'] = error
+            else:
+                windows.setdefault(end, []).append(ticker)
+
+        batches = [
+            (end, window_tickers[i:i + batch_size])
+            for end, window_tickers in windows.items()
+            for i in range(0, len(window_tickers), batch_size)
+        ]
+        for (end, batch_tickers), data, error, seconds in executor.map(fetch_batch, batches):
+            for ticker in batch_tickers:
+                report[ticker]['seconds'] += seconds
+                if error is not None:
+                    report[ticker]['error'] = error
+                    continue
+                ticker_data = data.loc[data['ticker'] == ticker].reset_index(drop=True)
+                if len(ticker_data) == 0:
+                    report[ticker]['error'] = 'No data returned'
+                    continue
+                raw[ticker] = ticker_data
+                report[ticker]['source'] = 'quandl'
+                if cache is not None:
+                    cache.put(ticker, ticker_data, end - relativedelta(years=5), end)
+
+    loaded = {}
+    for ticker in tickers:
+        if ticker not in raw:
+            continue
+        try:
+            loaded[ticker] = QuandlStockData(apikey, ticker, days=days, cache=cache, data=raw[ticker])
+        except Exception as e:
+            report[ticker]['error'] = str(e)
+    report = pd.DataFrame.from_dict(report, orient='index')
+    report.index.name = 'ticker'
+    return loaded, report
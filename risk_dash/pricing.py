@@ -0,0 +1,133 @@
+import numpy as np
+from scipy.special import ndtr
+
+from .simgen import crr_parameters
+
+
+def _d1_d2(spot, strike, vol, expiry, rate, dividend):
+    """
+    Helper function for the Black-Scholes d1 and d2 terms
+    """
+    deviation = vol * np.sqrt(expiry)
+    d1 = (np.log(spot / strike) + (rate - dividend + vol ** 2 / 2) * expiry) / deviation
+    return d1, d1 - deviation
+
+
+def black_scholes(spot, strike, vol, expiry, rate=0.0, dividend=0.0, call=True):
+    """
+    Black-Scholes price of European options. Every input can be an array, and they are broadcast together, so a book of options can be priced across every simulated path at once. Options at or past expiry are worth their intrinsic value
+
+    :param spot: float or np.array, price of the underlying
+    :param strike: float or np.array, strike price
+    :param vol: float or np.array, annualized volatility
+    :param expiry: float or np.array, time to expiry in years
+    :param rate: float or np.array, default 0, continuously compounded risk free rate
+    :param dividend: float or np.array, default 0, continuous dividend yield
+    :param call: bool or np.array of bool, default True, True for calls and False for puts
+
+    :return: np.array, the option prices
+    """
+    spot, strike, vol, expiry, rate, dividend, call = np.broadcast_arrays(
+        *[np.asarray(i, dtype=float) for i in (spot, strike, vol, expiry, rate, dividend)], np.asarray(call, dtype=bool)
+    )
+    sign = np.where(call, 1.0, -1.0)
+    intrinsic = np.maximum(sign * (spot - strike), 0)
+    live = expiry > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d1, d2 = _d1_d2(spot, strike, vol, expiry, rate, dividend)
+        price = sign * (
+            spot * np.exp(-dividend * expiry) * ndtr(sign * d1)
+            - strike * np.exp(-rate * expiry) * ndtr(sign * d2)
+        )
+    return np.where(live, price, intrinsic)
+
+
+def black_scholes_greeks(spot, strike, vol, expiry, rate=0.0, dividend=0.0, call=True):
+    """
+    Black-Scholes delta, gamma and vega of European options, inputs are broadcast as in black_scholes
+
+    :param spot: float or np.array, price of the underlying
+    :param strike: float or np.array, strike price
+    :param vol: float or np.array, annualized volatility
+    :param expiry: float or np.array, time to expiry in years
+    :param rate: float or np.array, default 0, continuously compounded risk free rate
+    :param dividend: float or np.array, default 0, continuous dividend yield
+    :param call: bool or np.array of bool, default True, True for calls and False for puts
+
+    :return: dict of np.array, delta, gamma and vega, vega per 1.00 change in volatility
+    """
+    spot, strike, vol, expiry, rate, dividend, call = np.broadcast_arrays(
+        *[np.asarray(i, dtype=float) for i in (spot, strike, vol, expiry, rate, dividend)], np.asarray(call, dtype=bool)
+    )
+    live = expiry > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d1, d2 = _d1_d2(spot, strike, vol, expiry, rate, dividend)
+        carry = np.exp(-dividend * expiry)
+        density = np.exp(-d1 ** 2 / 2) / np.sqrt(2 * np.pi)
+        delta = carry * np.where(call, ndtr(d1), ndtr(d1) - 1)
+        gamma = carry * density / (spot * vol * np.sqrt(expiry))
+        vega = spot * carry * density * np.sqrt(expiry)
+    expired_delta = np.where(call, (spot > strike) * 1.0, (spot < strike) * -1.0)
+    return {
+        'delta': np.where(live, delta, expired_delta),
+        'gamma': np.where(live, gamma, 0.0),
+        'vega': np.where(live, vega, 0.0)
+    }
+
+
+def crr_tree(spot, strike, vol, expiry, rate=0.0, call=True, steps=200, american=False):
+    """
+    Cox, Ross and Rubinstein binomial tree for options, with the tree step from simgen.crr_parameters. Inputs are broadcast and every option's tree is rolled back together, one step at a time across all options
+
+    :param spot: float or np.array, price of the underlying
+    :param strike: float or np.array, strike price
+    :param vol: float or np.array, annualized volatility
+    :param expiry: float or np.array, time to expiry in years
+    :param rate: float or np.array, default 0, continuously compounded risk free rate
+    :param call: bool or np.array of bool, default True, True for calls and False for puts
+    :param steps: int, default 200, number of tree steps to expiry, at least 2 so delta and gamma can be read from the first two steps
+    :param american: bool, default False, if True allow early exercise at every node
+
+    :return: tuple, (np.array prices, np.array delta, np.array gamma), delta and gamma from the first two steps of the tree
+    """
+    if steps < 2:
+        raise Exception('crr_tree needs at least 2 steps to compute delta and gamma')
+    spot, strike, vol, expiry, rate, call = np.broadcast_arrays(
+        *[np.asarray(i, dtype=float) for i in (spot, strike, vol, expiry, rate)], np.asarray(call, dtype=bool)
+    )
+    sign = np.where(call, 1.0, -1.0)[..., None]
+    live_expiry = np.where(expiry > 0, expiry, 1.0)
+    up, down, probability = crr_parameters(rate, vol, steps / live_expiry)
+    discount = np.exp(-rate * live_expiry / steps)[..., None]
+    up, down, probability = up[..., None], down[..., None], probability[..., None]
+    strike_nodes = strike[..., None]
+
+    def node_prices(level):
+        moves = np.arange(level + 1)
+        return spot[..., None] * up ** moves * down ** (level - moves)
+
+    values = np.maximum(sign * (node_prices(steps) - strike_nodes), 0)
+    levels = {steps: values}
+    for level in range(steps - 1, -1, -1):
+        values = discount * (probability * values[..., 1:] + (1 - probability) * values[..., :-1])
+        if american:
+            values = np.maximum(values, sign * (node_prices(level) - strike_nodes))
+        if level <= 2:
+            levels[level] = values
+    price = levels[0][..., 0]
+    first, second = node_prices(1), node_prices(2)
+    delta = (levels[1][..., 1] - levels[1][..., 0]) / (first[..., 1] - first[..., 0])
+    gamma = (
+        (levels[2][..., 2] - levels[2][..., 1]) / (second[..., 2] - second[..., 1])
+        - (levels[2][..., 1] - levels[2][..., 0]) / (second[..., 1] - second[..., 0])
+    ) / ((second[..., 2] - second[..., 0]) / 2)
+
+    # Expired options are worth their intrinsic value
+    expired = expiry <= 0
+    intrinsic = np.maximum(sign[..., 0] * (spot - strike), 0)
+    expired_delta = np.where(call, (spot > strike) * 1.0, (spot < strike) * -1.0)
+    return (
+        np.where(expired, intrinsic, price),
+        np.where(expired, expired_delta, delta),
+        np.where(expired, 0.0, gamma)
+    )
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ResultStore(object):
+    """
+    Store of computed results, each a dict of named numpy arrays, so dashboards can pass a short key between callbacks instead of serialized data. Results are kept in an in-process least recently used cache in front of a directory of .npz files, and the directory is shared by every process on the host, such as gunicorn workers
+
+    :param directory: string, folder to store result files in
+    :param max_memory_entries: int, default 32, results kept in memory per process
+    :param max_disk_entries: int or None, default 256, result files kept on disk, least recently used files are evicted past it
+    :param ttl: float or None, default 3600, seconds a result is served before it is recomputed, None never expires
+    """
+
+    def __init__(self, directory='.result_store', max_memory_entries=32, max_disk_entries=256, ttl=60 * 60):
+        self.directory = directory
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def entry_key(*parts):
+        """
+        Returns the key of a result from the parameters that produced it, safe to use as a file name. The readable prefix can repeat for different parameters once sanitized, so the key ends with a hash of the parameters' repr
+
+        :param parts: the parameters, such as ticker, lookback, obs and forward
+
+        :return: string
+        """
+        readable = re.sub(r'[^A-Za-z0-9._\-]', '-', '_'.join(str(i) for i in parts))[:64]
+        return readable + '_' + hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+    def path(self, key):
+        """
+        Returns the file path of a result
+
+        :param key: string, result key
+
+        :return: string
+        """
+        return os.path.join(self.directory, key + '.npz')
+
+    def expired(self, created):
+        """
+        Helper function to check a result's age against ttl
+
+        :param created: float, time the result was stored
+
+        :return: bool
+        """
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        """
+        Returns a stored result, from memory if this process has it, otherwise from disk
+
+        :param key: string, result key
+
+        :return: dict of string to numpy.array, or None if there is no live result
+        """
+        with self.lock:
+            if key in self.memory:
+                created, arrays = self.memory[key]
+                if not self.expired(created):
+                    self.memory.move_to_end(key)
+                    return arrays
+                del self.memory[key]
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                arrays = {name: stored[name] for name in stored.files}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        created = float(arrays.pop('_created'))
+        if self.expired(created):
+            return None
+        # Mark the file as recently used for eviction across processes
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.remember(key, created, arrays)
+        return arrays
+
+    def put(self, key, arrays):
+        """
+        Store a result in memory and atomically on disk
+
+        :param key: string, result key
+        :param arrays: dict of string to numpy.array or scalar, the result
+
+        :return: dict of string to numpy.array, the stored result
+        """
+        arrays = {name: np.asarray(value) for name, value in arrays.items()}
+        created = time.time()
+        # A unique temporary file, so writers of the same key in any thread or process never share one
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            np.savez(f, _created=created, **arrays)
+        os.replace(temp_path, self.path(key))
+        self.remember(key, created, arrays)
+        self.evict()
+        return arrays
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns a stored result, computing and storing it if there is none. Callers in one process asking for the same missing key wait for a single computation
+
+        :param key: string, result key
+        :param compute: callable, takes no arguments and returns the result as a dict of numpy arrays
+
+        :return: dict of string to numpy.array
+        """
+        arrays = self.get(key)
+        if arrays is not None:
+            return arrays
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another thread may have stored it while this one waited
+            arrays = self.get(key)
+            if arrays is None:
+                arrays = self.put(key, compute())
+        with self.lock:
+            if not key_lock.locked():
+                self.key_locks.pop(key, None)
+        return arrays
+
+    def remember(self, key, created, arrays):
+        """
+        Helper function to add a result to the in-process cache, evicting the least recently used past max_memory_entries
+
+        :param key: string, result key
+        :param created: float, time the result was stored
+        :param arrays: dict of string to numpy.array
+        """
+        with self.lock:
+            self.memory[key] = (created, arrays)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_memory_entries:
+                self.memory.popitem(last=False)
+
+    def evict(self):
+        """
+        Delete the least recently used result files past max_disk_entries
+        """
+        if self.max_disk_entries is None:
+            return
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                path = os.path.join(self.directory, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        files.sort()
+        for accessed, path in files[:max(len(files) - self.max_disk_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """
+        Remove every stored result
+        """
+        with self.lock:
+            self.memory.clear()
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from scipy.stats import norm
+
+
+class RollingCovariance(object):
+    """
+    Covariance matrix over a moving window of observations, updated in O(N ** 2) per observation by adding the newest and removing the oldest outer product
+
+    :param number_of_assets: int, number of columns in each observation
+    :param window: int, number of observations in the window
+    """
+
+    def __init__(self, number_of_assets, window):
+        self.window = window
+        self.count = 0
+        self.total = np.zeros(number_of_assets)
+        self.cross = np.zeros((number_of_assets, number_of_assets))
+
+    def add(self, observation):
+        """
+        Add an observation to the window
+
+        :param observation: numpy.array of shape (assets,)
+        """
+        self.total += observation
+        self.cross += np.outer(observation, observation)
+        self.count += 1
+
+    def remove(self, observation):
+        """
+        Remove an observation that is leaving the window
+
+        :param observation: numpy.array of shape (assets,)
+        """
+        self.total -= observation
+        self.cross -= np.outer(observation, observation)
+        self.count -= 1
+
+    def covariance(self):
+        """
+        Returns the sample covariance, ddof=1, of the observations in the window
+
+        :return: numpy.array of shape (assets, assets)
+        """
+        return (self.cross - np.outer(self.total, self.total) / self.count) / (self.count - 1)
+
+
+class EWMACovariance(object):
+    """
+    Exponentially weighted covariance matrix in the RiskMetrics form, cov = decay * cov + (1 - decay) * r * r.T, updated in O(N ** 2) per observation
+
+    :param initial: numpy.array of shape (assets, assets), the starting covariance
+    :param decay: float, default 0.94, weight kept on the previous covariance
+    """
+
+    def __init__(self, initial, decay=0.94):
+        self.decay = decay
+        self.cov = np.array(initial, dtype=float)
+
+    def add(self, observation):
+        """
+        Add an observation
+
+        :param observation: numpy.array of shape (assets,)
+        """
+        self.cov *= self.decay
+        self.cov += (1 - self.decay) * np.outer(observation, observation)
+
+    def covariance(self):
+        """
+        Returns the current covariance
+
+        :return: numpy.array of shape (assets, assets)
+        """
+        return self.cov
+
+
+class RollingRiskEngine(object):
+    """
+    Computes portfolio variance, parametric VaR, EWMA volatility and historic VaR at every date of a return history. Covariances are updated incrementally rather than re-estimated at each date, so a full history costs O(T * N ** 2)
+
+    :param returns: numpy.array of shape (dates, assets), log returns, such as Portfolio.get_portfolio_panel('percentchange').values
+    :param weights: numpy.array of shape (assets,), the portfolio weight of each column
+    :param window: int, default 250, number of observations in the rolling window, also used to start the EWMA covariance
+    :param decay: float, default 0.94, EWMA decay
+    :param confidence: float, default 2.5, VaR percentile in percentage
+    :param var_horizon: int, default 10, how many days/periods forward VaR is calculated
+    """
+
+    def __init__(self, returns, weights, window=250, decay=0.94, confidence=2.5, var_horizon=10):
+        self.returns = np.asarray(returns, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.window = window
+        self.decay = decay
+        self.confidence = confidence
+        self.var_horizon = var_horizon
+
+    def run(self, keep_covariances=False):
+        """
+        Walk through the history and compute every series. Values at a date use the observations up to and including it, dates before a full window are NaN
+
+        :param keep_covariances: bool, if True also return the rolling and EWMA covariance matrices at every date
+
+        :return: dict of numpy.array, variance, value_at_risk, ewma_variance, ewma_volatility, ewma_value_at_risk and historic_value_at_risk, each of shape (dates,), plus covariance and ewma_covariance of shape (dates, assets, assets) if keep_covariances
+        """
+        critical_value = norm.ppf(self.confidence / 100)
+        if keep_covariances:
+            variance, ewma_variance, covariances, ewma_covariances = self.covariance_history()
+        else:
+            variance, ewma_variance = self.portfolio_variance()
+
+        output = {
+            'variance': variance,
+            'value_at_risk': np.sqrt(variance * self.var_horizon) * critical_value,
+            'ewma_variance': ewma_variance,
+            'ewma_volatility': np.sqrt(ewma_variance),
+            'ewma_value_at_risk': np.sqrt(ewma_variance * self.var_horizon) * critical_value,
+            'historic_value_at_risk': self.historic_value_at_risk()
+        }
+        if keep_covariances:
+            output['covariance'] = covariances
+            output['ewma_covariance'] = ewma_covariances
+        return output
+
+    def covariance_history(self):
+        """
+        Update the rolling and EWMA covariance matrices through the history, O(N ** 2) per date
+
+        :return: tuple, (numpy.array variance, numpy.array ewma_variance, numpy.array covariances, numpy.array ewma_covariances), variances of shape (dates,) and covariances of shape (dates, assets, assets)
+        """
+        dates, assets = self.returns.shape
+        variance = np.full(dates, np.nan)
+        ewma_variance = np.full(dates, np.nan)
+        covariances = np.full((dates, assets, assets), np.nan)
+        ewma_covariances = np.full((dates, assets, assets), np.nan)
+
+        rolling = RollingCovariance(assets, self.window)
+        ewma = None
+        for i in range(dates):
+            observation = self.returns[i]
+            rolling.add(observation)
+            if i >= self.window:
+                rolling.remove(self.returns[i - self.window])
+            if ewma is not None:
+                ewma.add(observation)
+            if i < self.window - 1:
+                continue
+            covariances[i] = rolling.covariance()
+            if ewma is None:
+                ewma = EWMACovariance(covariances[i], self.decay)
+            ewma_covariances[i] = ewma.covariance()
+            variance[i] = self.weights @ covariances[i] @ self.weights
+            ewma_variance[i] = self.weights @ ewma_covariances[i] @ self.weights
+        return variance, ewma_variance, covariances, ewma_covariances
+
+    def portfolio_variance(self):
+        """
+        Rolling and EWMA portfolio variance without the covariance matrices. With fixed weights, weights.T * Cov * weights over a window equals the variance of the portfolio return series over it, and the EWMA recursion carries over the same way, so each date costs O(N) for the portfolio return rather than O(N ** 2)
+
+        :return: tuple, (numpy.array variance, numpy.array ewma_variance), each of shape (dates,)
+        """
+        portfolio = self.returns @ self.weights
+        variance = pd.Series(portfolio).rolling(self.window).var().values
+        ewma_variance = np.full(len(portfolio), np.nan)
+        first = self.window - 1
+        if len(portfolio) > first:
+            # ewma[t] = decay * ewma[t - 1] + (1 - decay) * portfolio[t] ** 2, started from the first window's variance
+            ewma_variance[first] = variance[first]
+            ewma_variance[first + 1:] = lfilter(
+                [1 - self.decay], [1, -self.decay], portfolio[first + 1:] ** 2, zi=[self.decay * variance[first]]
+            )[0]
+        return variance, ewma_variance
+
+    def historic_value_at_risk(self):
+        """
+        Percentile of the overlapping var_horizon portfolio returns within each rolling window
+
+        :return: numpy.array of shape (dates,)
+        """
+        portfolio = self.returns @ self.weights
+        horizon_returns = pd.Series(portfolio).rolling(self.var_horizon).sum().values
+        horizon_returns = np.exp(horizon_returns) - 1
+        output = np.full(len(portfolio), np.nan)
+        if len(portfolio) < self.window:
+            return output
+        windows = np.lib.stride_tricks.sliding_window_view(horizon_returns, self.window)
+        # Windows that are still all NaN at the start of the history stay NaN
+        valid = np.isfinite(windows).any(axis=1)
+        output[self.window - 1:][valid] = np.nanpercentile(windows[valid], self.confidence, axis=1)
+        return output
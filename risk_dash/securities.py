@@ -1,4 +1,7 @@
-from . import market_data as md
+from . import market_data as md, simgen as mc, pricing
+from .rolling import RollingRiskEngine
+from .backtest import VaRBacktest
+from .stress import StressTest
 import pandas as pd
 import numpy as np
 from scipy.stats import norm, t
@@ -95,38 +98,481 @@ class Equity(_Security):
         self.marked_change = self.valuation(current_price)
         return(self.marked_change)
 
-    def simulate(self, SimulationGenerator, periods_forward, number_of_simulations):
+    def simulate(self, SimulationGenerator, periods_forward, number_of_simulations, chunk_size=None, executor=None, seed=None):
         """
         Function to run simulation at the Equity based level
+
+        :param SimulationGenerator: simgen._Simulation, the simulation to run
+        :param periods_forward: int, how many steps into the future to simulate
+        :param number_of_simulations: int, how many paths to simulate
+        :param chunk_size: int or None, if set, or if executor or seed is set, run SimulationGenerator.simulate_chunked in blocks of this many paths and do not keep all_sims
+        :param executor: concurrent.futures.Executor or None, executor to spread path blocks across
+        :param seed: int or None, master seed for reproducible per block random draws
+
+        :return: tuple, (np.array simulation_mean, np.array simulation_std)
         """
 
-        self.all_sims = SimulationGenerator.simulate(periods_forward, number_of_simulations)
+        if chunk_size or executor is not None or seed is not None:
+            SimulationGenerator.simulate_chunked(
+                periods_forward,
+                number_of_simulations,
+                chunk_size=chunk_size or 10000,
+                executor=executor,
+                seed=seed
+            )
+            self.all_sims = None
+        else:
+            self.all_sims = SimulationGenerator.simulate(periods_forward, number_of_simulations)
         self.simulation_mean = SimulationGenerator.simulation_mean
         self.simulation_std = SimulationGenerator.simulation_std
         self.simulated_distribution = SimulationGenerator.simulated_distribution
+        self.simulation_summary = SimulationGenerator.summary
 
         return self.simulation_mean, self.simulation_std
 
+class Option(_Security):
+    """
+    The Option class represents a listed option position on an equity. The position is valued from the underlying price with Black-Scholes, or a Cox, Ross and Rubinstein tree for American exercise, and valuation accepts arrays of underlying prices so the position can be revalued across every simulated path at once
+
+    :param ticker: string, the underlying ticker
+    :param market_data: market_data._StockData, market data of the underlying
+    :param ordered_price: float, premium paid per option
+    :param quantity: float, number of options, negative if written
+    :param date_ordered: date the position was opened
+    :param strike: float, strike price
+    :param expiry: date of expiry
+    :param call: bool, default True, True for a call and False for a put
+    :param vol: float or None, annualized volatility, None uses the underlying's exponentially weighted volatility
+    :param rate: float, default 0, continuously compounded risk free rate
+    :param method: string, default 'black_scholes', 'black_scholes' or 'crr'
+    :param steps: int, default 200, number of tree steps for method='crr'
+    :param american: bool, default False, allow early exercise for method='crr'
+    """
+
+    def __init__(self, ticker, market_data : md._StockData, ordered_price, quantity, date_ordered, strike, expiry, call=True, vol=None, rate=0.0, method='black_scholes', steps=200, american=False):
+
+        self.ticker = ticker
+        self.market_data = market_data
+        self.ordered_price = ordered_price
+        self.quantity = quantity
+        self.initial_value = ordered_price * quantity
+        self.date_ordered = date_ordered
+        self.strike = strike
+        self.expiry = pd.Timestamp(expiry)
+        self.call = call
+        self.vol = vol
+        self.rate = rate
+        self.method = method
+        self.steps = steps
+        self.american = american
+        if method == 'crr' and steps < 2:
+            raise Exception("method='crr' needs at least 2 steps")
+        self.type = 'Option'
+        self.name = '{} {:g}{} {:%Y-%m-%d}'.format(ticker, strike, 'C' if call else 'P', self.expiry)
+
+    def get_vol(self):
+        """
+        Returns the annualized volatility used for pricing
+
+        :return: float
+        """
+        if self.vol is not None:
+            return self.vol
+        return self.market_data.currentexvol * np.sqrt(252)
+
+    def time_to_expiry(self, days_forward=0):
+        """
+        Returns the time to expiry in years from the last market data date, in trading days
+
+        :param days_forward: int or np.array, default 0, trading days after the last market data date, such as a simulation horizon
+
+        :return: float or np.array
+        """
+        days = np.busday_count(
+            self.market_data.market_data.index[-1].date(),
+            self.expiry.date()
+        ) - np.asarray(days_forward)
+        return np.maximum(days, 0) / 252
+
+    def price(self, spot, days_forward=0):
+        """
+        Returns the option price for underlying prices
+
+        :param spot: float or np.array, underlying prices
+        :param days_forward: int or np.array, default 0, trading days after the last market data date, broadcast against spot
+
+        :return: np.array of option prices of the same shape as spot
+        """
+        expiry = self.time_to_expiry(days_forward)
+        if self.method == 'crr':
+            return pricing.crr_tree(spot, self.strike, self.get_vol(), expiry, self.rate, self.call, self.steps, self.american)[0]
+        return pricing.black_scholes(spot, self.strike, self.get_vol(), expiry, self.rate, call=self.call)
+
+    def greeks(self, spot=None, days_forward=0):
+        """
+        Returns the position's delta, gamma and vega, the per option greeks times quantity
+
+        :param spot: float, np.array or None, underlying prices, None uses the current price
+        :param days_forward: int, default 0, trading days after the last market data date
+
+        :return: dict of np.array, delta, gamma and vega
+        """
+        if spot is None:
+            spot = self.market_data.current_price()
+        expiry = self.time_to_expiry(days_forward)
+        greeks = pricing.black_scholes_greeks(spot, self.strike, self.get_vol(), expiry, self.rate, call=self.call)
+        if self.method == 'crr':
+            greeks['delta'], greeks['gamma'] = pricing.crr_tree(
+                spot, self.strike, self.get_vol(), expiry, self.rate, self.call, self.steps, self.american
+            )[1:]
+        return {name: value * self.quantity for name, value in greeks.items()}
+
+    def valuation(self, price, days_forward=0):
+        """
+        Returns the change in value of the position given underlying prices, the option price less the premium paid, multiplied by the quantity of the position
+
+        :param price: float or np.array, represents underlying prices
+        :param days_forward: int or np.array, default 0, trading days after the last market data date, broadcast against price
+
+        :return: the value of the Option at the given prices
+        """
+        return (self.price(price, days_forward) - self.ordered_price) * self.quantity
+
+    def mark_to_market(self, current_price):
+        """
+        Returns the current value of the Option given the current underlying price
+
+        :param current_price: float, represents the current price of the underlying
+
+        :return: the value of the Option at current market prices
+        """
+        self.market_value = self.quantity * float(self.price(current_price))
+        self.marked_change = float(self.valuation(current_price))
+        return(self.marked_change)
+
 class Trade(object):
+    """
+    The Trade class backtests a strategy over the aligned price history of its securities. Each security is valued with its own valuation method, and a position of p units in a security held from one date to the next earns p times the change in that security's valuation
+
+    Positions for every date, and optionally for many strategy variants at once, are evaluated as array operations, so sweeping variants does not loop over dates
+
+    :param securities: list of _Security objects
+    :param key: string, market_data column of prices to value the securities with
+    :param strategy: callable or None, takes the price history as a numpy.array of shape (dates, securities) and returns positions of shape (dates, securities), or (variants, dates, securities) to run several variants. The positions at a date should only use prices up to that date. If None, one unit of each security is held throughout
+    """
+
+    def __init__(self, securities, key='adj_close', strategy=None):
+        self.securities = list(securities)
+        self.names = [i.name for i in self.securities]
+        self.key = key
+        self.strategy = strategy
+        self.set_prices()
+        self.reset()
+
+    def set_prices(self):
+        """
+        Align the securities' prices on their shared dates and value each security at every date
+        """
+        frame = pd.concat(
+            [i.get_marketdata().market_data[self.key] for i in self.securities],
+            axis=1,
+            keys=self.names,
+            join='inner'
+        ).dropna()
+        self.dates = frame.index
+        self.prices = frame.values.astype(float)
+        self.valuations = self.valuation(self.prices)
+
+    def valuation(self, prices):
+        """
+        Value each security at the given prices
+
+        :param prices: numpy.array of shape (..., securities), leading axes such as dates are broadcast
+
+        :return: numpy.array of the same shape
+        """
+        prices = np.asarray(prices, dtype=float)
+        return np.stack(
+            [security.valuation(prices[..., i]) for i, security in enumerate(self.securities)],
+            axis=-1
+        )
+
+    def value(self, current_prices, positions=None):
+        """
+        Returns the value of the positions at current prices
+
+        :param current_prices: dict of security name to price, or list-like float in the order of securities
+        :param positions: list-like float or None, units of each security, None uses the positions currently held, or one unit of each if nothing is held yet
+
+        :return: float, the total value
+        """
+        if isinstance(current_prices, dict):
+            current_prices = [current_prices[i] for i in self.names]
+        if positions is None:
+            positions = self.held if self.held is not None else np.ones(len(self.securities))
+        return float(np.dot(self.valuation(current_prices), positions))
+
+    def choice(self, prices):
+        """
+        The strategy decision, the positions to hold at every date of prices
+
+        :param prices: numpy.array of shape (dates, securities), the price history up to the decision dates
+
+        :return: numpy.array of shape (dates, securities) or (variants, dates, securities)
+        """
+        if self.strategy is None:
+            return np.ones(prices.shape)
+        return np.asarray(self.strategy(prices), dtype=float)
 
-    def __init__(self, securities):
-        self.securities = securities
+    def run(self, positions=None):
+        """
+        Replay the strategy over the full price history in one pass. Positions chosen at a date earn the change in valuation to the next date
+
+        :param positions: numpy.array or None, positions of shape (dates, securities) or (variants, dates, securities), None asks .choice with the full price history
+
+        :return: numpy.array of shape (dates,), or (variants, dates), the cumulative trade value, starting at 0, also kept as run_value apart from the .step state
+        """
+        if positions is None:
+            positions = self.choice(self.prices)
+        positions = np.asarray(positions, dtype=float)
+        changes = np.diff(self.valuations, axis=0)
+        step_values = np.einsum('...tn,tn->...t', positions[..., :-1, :], changes)
+        trade_value = np.zeros(step_values.shape[:-1] + (len(self.dates),))
+        np.cumsum(step_values, axis=-1, out=trade_value[..., 1:])
+        self.positions = positions
+        self.run_value = trade_value
+        return trade_value
+
+    def reset(self):
+        """
+        Clear the state used by .step
+        """
+        self.current = None
+        self.held = None
         self.trade_value = [0]
 
-    def value(self, current_prices):
-        value = 0
-        for i in self.securities:
-            value += i.valuation(current_prices[i.name])
+    def step(self, date=None, positions=None, variant=None):
+        """
+        Advance one date, for strategies run date by date. The first step only takes the initial positions, each later step books the change in valuation of the positions held since the previous step
+
+        :param date: date or None, the date to step to, None steps to the next date
+        :param positions: list-like float or None, the units to hold from this date, None asks .choice with the price history up to this date
+        :param variant: int or None, which variant to follow when the strategy returns positions of shape (variants, dates, securities)
+
+        :return: float, the trade value after the step
+        """
+        i = (0 if self.current is None else self.current + 1) if date is None else self.dates.get_loc(date)
+        if positions is None:
+            choice = self.choice(self.prices[:i + 1])
+            if choice.ndim == 3:
+                if variant is None:
+                    raise Exception('The strategy returns several variants, pass variant to .step to choose one')
+                choice = choice[variant]
+            positions = choice[-1]
+        if self.current is not None:
+            change = np.dot(self.held, self.valuations[i] - self.valuations[self.current])
+            self.trade_value.append(self.trade_value[-1] + change)
+        self.held = np.asarray(positions, dtype=float)
+        self.current = i
+        return self.trade_value[-1]
+
+class PortfolioBook(object):
+    """
+    Columnar view of a portfolio's positions. Quantities, ordered prices, initial values, current prices, last dates and type codes are held in numpy arrays in the order of keys, so portfolio level calculations are single array operations
+
+    :param port: dict of key to _Security, the Portfolio.port attribute
+    """
+
+    # Security types whose valuation is computed directly on the arrays, other types fall back to their own valuation method
+    TYPE_CODES = {
+        'Equity': 0,
+        'Option': 1
+    }
+
+    def __init__(self, port):
+        self.keys = list(port.keys())
+        self.securities = list(port.values())
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self.quantity = np.array([security.quantity for security in self.securities], dtype=float)
+        self.ordered_price = np.array([security.ordered_price for security in self.securities], dtype=float)
+        self.initial_value = np.array([security.initial_value for security in self.securities], dtype=float)
+        self.type_code = np.array([self.TYPE_CODES.get(security.type, -1) for security in self.securities])
+        self.linear = self.type_code == self.TYPE_CODES['Equity']
+        self.refresh()
+
+    def refresh(self):
+        """
+        Re-read the current price and last available date of each position from its market data
+        """
+        # Positions often share market data objects, so each one is read once
+        latest = {}
+        for security in self.securities:
+            data = security.get_marketdata()
+            if id(data) not in latest:
+                latest[id(data)] = (data.current_price(), data.market_data.index[-1])
+        latest = [latest[id(security.get_marketdata())] for security in self.securities]
+        self.current_price = np.array([price for price, date in latest], dtype=float)
+        self.last_date = pd.DatetimeIndex([date for price, date in latest]).values
+
+    def valuation(self, prices):
+        """
+        Value every position at the given prices
+
+        :param prices: numpy.array of shape (..., positions), prices in the order of keys, leading axes such as scenarios or paths are broadcast
+
+        :return: numpy.array of the same shape, the value of each position
+        """
+        prices = np.asarray(prices, dtype=float)
+        value = (prices - self.ordered_price) * self.quantity
+        for i in np.flatnonzero(~self.linear):
+            value[..., i] = self.securities[i].valuation(prices[..., i])
+        return value
+
+    def market_value(self, prices):
+        """
+        Market value of every position at the given prices, non-linear positions such as options at their own price
+
+        :param prices: numpy.array of shape (..., positions), underlying prices in the order of keys
+
+        :return: numpy.array of the same shape
+        """
+        prices = np.asarray(prices, dtype=float)
+        value = prices * self.quantity
+        for i in np.flatnonzero(~self.linear):
+            value[..., i] = self.securities[i].price(prices[..., i]) * self.quantity[i]
+        return value
+
+
+class PricePanel(object):
+    """
+    Market data for every position aligned on one shared date index, held as a single (dates, positions) float array with the position weights kept separately
+
+    :param values: numpy.array of shape (dates, positions)
+    :param index: pandas DatetimeIndex, the shared dates
+    :param columns: list of string, the position keys in column order
+    :param weights: numpy.array of shape (positions,), the portfolio weight of each column
+    """
+
+    def __init__(self, values, index, columns, weights):
+        self.values = values
+        self.index = index
+        self.columns = list(columns)
+        self.weights = weights
+
+    @classmethod
+    def from_portfolio(cls, portfolio, key):
+        """
+        Build the panel for a Portfolio in one concat and reindex pass
+
+        :param portfolio: Portfolio, the portfolio whose positions make up the columns
+        :param key: string, common market_data column name for each security
+
+        :return: PricePanel
+        """
+        book = portfolio.get_book()
+        weights = portfolio.get_weights()
+        frame = pd.concat(
+            [security.get_marketdata().market_data[key] for security in book.securities],
+            axis=1,
+            keys=book.keys
+        ).reindex(portfolio.get_date())
+        frame = frame.dropna().interpolate('linear').bfill()
+        return cls(
+            frame.values.astype(float),
+            frame.index,
+            book.keys,
+            np.array([weights[i] for i in book.keys])
+        )
+
+    @classmethod
+    def from_frame(cls, market_data, weights):
+        """
+        Build the panel from a portfolio level market_data DataFrame in the layout of Portfolio.set_portfolio_marketdata
+
+        :param market_data: pandas DataFrame, one column per position, any weighted and portfolio columns are ignored
+        :param weights: dict, the weight of each position
+
+        :return: PricePanel
+        """
+        columns = [i for i in market_data.columns if i in weights]
+        return cls(
+            market_data.loc[:, columns].values.astype(float),
+            market_data.index,
+            columns,
+            np.array([weights[i] for i in columns])
+        )
+
+    def weighted(self):
+        """
+        Returns the weighted value of each column
+
+        :return: numpy.array of shape (dates, positions)
+        """
+        return self.values * self.weights
+
+    def cov(self, lookback_periods=0):
+        """
+        Returns the covariance matrix of the columns
+
+        :param lookback_periods: int, how many of the latest dates to use, 0 uses every date
+
+        :return: numpy.array of shape (positions, positions)
+        """
+        values = self.values if lookback_periods == 0 else self.values[-lookback_periods:]
+        return np.atleast_2d(np.cov(values, rowvar=False))
+
+    def portfolio(self):
+        """
+        Returns the weighted sum across columns
+
+        :return: numpy.array of shape (dates,)
+        """
+        return self.values @ self.weights
+
+    def frame(self):
+        """
+        Returns the panel values as a pandas DataFrame with one column per position
+
+        :return: pandas DataFrame
+        """
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns)
+
+    def weighted_frame(self):
+        """
+        Returns the weighted columns, named with a _port_weighted suffix, and the portfolio column
+
+        :return: pandas DataFrame
+        """
+        weighted = self.weighted()
+        return pd.DataFrame(
+            np.column_stack([weighted, weighted.sum(axis=1)]),
+            index=self.index,
+            columns=[i + '_port_weighted' for i in self.columns] + ['portfolio']
+        )
 
-    def step(self, date, **kwargs):
-        self.choice()
-        current_prices = []
-        for i in self.securities:
-            current_prices[i.name] = i.market_data.loc[i.market_data['datelab'] == kwargs['date'], kwargs['pricelab']]
-        self.trade_value.append(self.value(current_prices))
+    def to_frame(self):
+        """
+        Returns the panel in the layout of Portfolio.market_data, the position columns, their _port_weighted copies and the portfolio column
+
+        :return: pandas DataFrame
+        """
+        return self.frame().join(self.weighted_frame())
+
+    @staticmethod
+    def log_returns(values):
+        """
+        Log returns of flat price values down each column, columns that are always negative, short positions, are negated first
+
+        :param values: numpy.array of shape (dates, columns)
+
+        :return: numpy.array of the same shape, the first row is NaN
+        """
+        sign = np.where(np.nanmax(values, axis=0) < 0, -1.0, 1.0)
+        returns = np.full(values.shape, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns[1:] = np.diff(np.log(values * sign), axis=0)
+        return returns
 
-    def choice(self):
-        pass
 
 class Portfolio(object):
     """
@@ -135,25 +581,93 @@ class Portfolio(object):
     :param securities: list of _Security objects or None, if None, the object will try to create the port attribute using other data, if a list it will use the list of _Security objects
     :param data_input: pandas.DataFrame, str, or None. If None and securities is None, no port attribute will be made and be an empty portfolio. Either pandas DataFrame or string path to a portfolio matching './portfolio_example.csv'
     :param apikey: str, ApiKey for the market data object
+    :param cache: market_data.MarketDataCache or None, local cache used when constructing market data objects from data_input
 
     """
 
-    def __init__(self, securities=None, data_input=None, apikey=None):
+    def __init__(self, securities=None, data_input=None, apikey=None, cache=None):
         self.port = None
+        self.market_data_key = None
         if securities is not None:
             for asset in securities:
                 self.add_security(asset)
         elif data_input is not None and apikey is not None:
-            self.construct_portfolio_csv(data_input, apikey)
+            self.construct_portfolio_csv(data_input, apikey, cache=cache)
         else:
             self.port = None
 
+    @property
+    def port(self):
+        """
+        dict of key, name + ' ' + type, to _Security
+        """
+        return self._port
+
+    @port.setter
+    def port(self, port):
+        self._port = port
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Discard the position book, the weights and every memoized analytic, called whenever the positions change
+        """
+        self._book = None
+        self._book_state = None
+        self._analytics = {}
+        self._analytics_state = None
+        self.__dict__.pop('weights', None)
+
+    def market_data_state(self):
+        """
+        Returns a fingerprint of the underlying market data, the identity and version of each market data object, used to tell when memoized analytics are stale
+
+        :return: tuple
+        """
+        return tuple(
+            (id(security.get_marketdata()), getattr(security.get_marketdata(), 'version', None))
+            for security in (self.port or {}).values()
+        )
+
+    def memoize(self, key, build, recalc=False):
+        """
+        Return the analytic stored under key, calling build to compute it if it is missing, if recalc is set, or if the market data changed since it was stored. Analytics are also discarded by .invalidate and .set_weights
+
+        :param key: tuple, the name of the analytic followed by the inputs it depends on
+        :param build: callable, computes the analytic with no arguments
+        :param recalc: bool, if True always recompute
+
+        :return: the analytic
+        """
+        state = self.market_data_state()
+        if state != self._analytics_state:
+            self._analytics = {}
+            self._analytics_state = state
+        if recalc or key not in self._analytics:
+            self._analytics[key] = build()
+        return self._analytics[key]
+
+    def get_book(self):
+        """
+        Returns the PortfolioBook for the current positions, building it if the positions changed and refreshing its prices if the market data changed, see .market_data_state
+
+        :return: PortfolioBook
+        """
+        state = self.market_data_state()
+        if self._book is None:
+            self._book = PortfolioBook(self.port)
+        elif state != self._book_state:
+            self._book.refresh()
+        self._book_state = state
+        return self._book
+
     def add_security(self, security, overwrite=True):
         """
         Helper function to add _Security object to port attribute
 
         :param security: _Security, _Security object to add to port dictionary
         """
+        self.invalidate()
         if self.port is not None:
             if (security.name + ' ' + security.type not in self.port.keys()) or overwrite:
                 self.port[security.name + ' ' + security.type] = security
@@ -171,6 +685,7 @@ class Portfolio(object):
         :param security_name: str, Name of the security for .port key, to match _Security.name
         :param security_type: str, String to match _Security.type of the _Security object to be removed
         """
+        self.invalidate()
         try:
             if security is not None:
                 self.port.pop(security.name + ' ' + security.type)
@@ -188,25 +703,29 @@ class Portfolio(object):
         :return: value of the portfolio
 
         """
-        value = 0
-        for i in self.port.keys():
-            value += self.port[i].valuation(self.port[i].market_data.current_price())
-        return value
+        book = self.get_book()
+        book.refresh()
+        return book.valuation(book.current_price).sum()
 
     def mark(self):
         """
         Mark portfolio with current market prices, sets marked_portfolio and market_change.
         """
-        val = 0
-        port_val = {}
-        for i in self.port.keys():
-            temp = self.port[i].mark_to_market(self.port[i].market_data.current_price())
-            val += temp
-            port_val[i] = (self.port[i].initial_value, self.port[i].market_value)
-        self.market_change = val
-        self.marked_portfolio = port_val
+        book = self.get_book()
+        book.refresh()
+        marked_change = book.valuation(book.current_price)
+        market_value = book.market_value(book.current_price)
+        for i, security in enumerate(book.securities):
+            if book.linear[i]:
+                security.market_value = market_value[i]
+                security.marked_change = marked_change[i]
+            else:
+                security.mark_to_market(book.current_price[i])
+                market_value[i] = security.market_value
+        self.market_change = marked_change.sum()
+        self.marked_portfolio = dict(zip(book.keys, zip(book.initial_value, market_value)))
         self.date_marked = self.get_last_shared_date()
-        self.initial_value = sum(port_val[i][0] for i in port_val.keys())
+        self.initial_value = book.initial_value.sum()
 
     def get_date(self):
         """
@@ -229,11 +748,7 @@ class Portfolio(object):
         :return: DateTime object
 
         """
-        temp = min(
-            self.port[i].get_marketdata().market_data.index[-1]
-            for i in self.port.keys()
-        )
-        return temp
+        return pd.Timestamp(self.get_book().last_date.min())
 
     def set_portfolio_marketdata(self, key):
         """
@@ -245,37 +760,65 @@ class Portfolio(object):
 
         """
         try:
-            marketdata = pd.DataFrame(index = self.get_date())
-            weights = self.get_weights()
-            for i in self.port.keys():
-                marketdata[i] = self.port[i].get_marketdata().market_data[key]
-                marketdata[i + '_port_weighted'] = marketdata[i] * weights[i]
-            marketdata = marketdata.dropna()
-            marketdata = marketdata.interpolate('linear').bfill()
-            marketdata['portfolio'] = marketdata.loc[:,marketdata.columns.str.contains('_port_weighted')].sum(axis=1)
-            self.market_data = marketdata
+            self.panel = self.memoize(('panel', key), lambda: PricePanel.from_portfolio(self, key), recalc=True)
+            self.market_data = self.memoize(('market_data', key), self.panel.to_frame, recalc=True)
             self.market_data_key = key
-            return(marketdata)
-        except ValueError:
+            return(self.market_data)
+        except (KeyError, ValueError):
             print('Supply key value in pandas data frame')
 
     def get_portfolio_marketdata(self, key = None, recalc=False):
         """
-        Returns self.market_data
+        Returns self.market_data for key, built once per key and reused until the positions, weights or market data change
 
-        :param key: If not set, use key to set market_data
+        :param key: Common column name for each security, if not set, use the last key used
 
         :return: pandas DataFrame self.market_data
 
         """
-        if key or recalc or (key != self.market_data_key):
+        if key is None:
+            key = self.market_data_key
+        if key is None:
+            raise Exception("Must set market_data with .set_portfolio_marketdata()")
+        if recalc:
+            return self.set_portfolio_marketdata(key)
+        self.get_portfolio_panel(key)
+        return self.market_data
+
+    def get_portfolio_panel(self, key = None, recalc=False):
+        """
+        Returns self.panel, the PricePanel behind self.market_data, built once per key and reused until the positions, weights or market data change. self.market_data is kept in step with the panel's key
+
+        :param key: Common column name for each security, if not set, use the last key used
+
+        :return: PricePanel self.panel
+
+        """
+        if key is None:
+            key = self.market_data_key
+        if key is None:
+            raise Exception("Must set market_data with .set_portfolio_marketdata()")
+        if recalc:
             self.set_portfolio_marketdata(key)
-            return self.market_data
-        else:
-            try:
-                return self.market_data
-            except:
-                raise Exception("Must set market_data with .set_portfolio_marketdata()")
+            return self.panel
+        self.panel = self.memoize(('panel', key), lambda: PricePanel.from_portfolio(self, key))
+        self.market_data = self.memoize(('market_data', key), self.panel.to_frame)
+        self.market_data_key = key
+        return self.panel
+
+    def get_log_returns(self, key='adj_close'):
+        """
+        Returns the log returns of each position and of the portfolio, the last column, for key
+
+        :param key: string, corresponds to the market_data column of flat prices
+
+        :return: numpy.array of shape (dates, positions + 1), the first row is NaN
+        """
+        panel = self.get_portfolio_panel(key)
+        return self.memoize(
+            ('log_returns', key),
+            lambda: PricePanel.log_returns(np.column_stack([panel.values, panel.portfolio()]))
+        )
 
     def calculate_portfolio_returns(self, market_data):
         """
@@ -309,13 +852,16 @@ class Portfolio(object):
 
         """
 
-        market_data = self.get_portfolio_marketdata(key)
-        market_data = market_data.loc[
-            :,
-            market_data.columns.str.contains('port')
-        ]
+        panel = self.get_portfolio_panel(key)
         if returns == True:
-            market_data = self.calculate_portfolio_returns(market_data)
+            # Weighted columns have the same log returns as the unweighted ones
+            market_data = pd.DataFrame(
+                self.get_log_returns(key),
+                index=panel.index,
+                columns=[i + '_port_weighted' for i in panel.columns] + ['portfolio']
+            )
+        else:
+            market_data = panel.weighted_frame()
         if plot and returns:
             np.exp(market_data.cumsum()).plot(figsize=figsize)
         elif plot and not returns:
@@ -332,15 +878,10 @@ class Portfolio(object):
         :return: dict for each security weight
 
         """
-        port_val = {
-            name : security.quantity * security.ordered_price
-            for name, security in self.port.items()
-        }
-        total_val = sum(port_val.values())
-        weights = {
-            name : security_value / total_val
-            for name, security_value in port_val.items()
-        }
+        book = self.get_book()
+        self._analytics = {}
+        port_val = book.quantity * book.ordered_price
+        weights = dict(zip(book.keys, port_val / port_val.sum()))
         self.weights = weights
         return(weights)
 
@@ -371,24 +912,18 @@ class Portfolio(object):
 
         """
         if market_data is None:
-            market_data = self.get_portfolio_marketdata(key)
-        if lookback_periods == 0:
-            covar = market_data.loc[:, ~market_data.columns.str.contains('port')].cov()
+            panel = self.get_portfolio_panel(key)
+            cov_mat = self.memoize(('cov', key, lookback_periods), lambda: panel.cov(lookback_periods))
         else:
-            covar = market_data.loc[
-                market_data.index[-lookback_periods:],
-                ~market_data.columns.str.contains('port')
-            ].cov()
-        weights = self.get_weights()
-        order = covar.columns
-        weight_array = np.array([weights[i] for i in order])
-        cov_mat = np.array(covar)
+            panel = PricePanel.from_frame(market_data, self.get_weights())
+            cov_mat = panel.cov(lookback_periods)
+        weight_array = panel.weights
         variance = np.matmul(np.matmul(weight_array.T, cov_mat), weight_array)
         if lookback_periods == 0:
             VaR = np.sqrt(variance * var_horizon) * confidence_interval
         else:
             VaR = np.sqrt(variance * var_horizon) * t.ppf(.025, df=lookback_periods-1)
-        self.cov = covar
+        self.cov = pd.DataFrame(cov_mat, index=panel.columns, columns=panel.columns)
         self.port_variance = variance
         self.parametric_portfolio_value_at_risk = VaR
         return variance, VaR
@@ -413,6 +948,186 @@ class Portfolio(object):
         except:
             raise Exception('Must set port_variance with .set_port_variance()')
 
+    def var_attribution(self, confidence_interval = norm.ppf(.025), var_horizon = 10, lookback_periods=0, key='percentchange'):
+        """
+        Decompose parametric VaR by position from one Cov * Weight product
+
+        Marginal VaR is the change in VaR per unit of weight, component VaR is weight * marginal VaR and the components sum to the portfolio VaR, incremental VaR is the portfolio VaR less the VaR with the position removed and the other weights unchanged, using Var(without i) = Var - 2 * w_i * (Cov * w)_i + w_i ** 2 * Cov_ii
+
+        :param confidence_interval: float, The critical value to implement parametric VaR
+        :param var_horizon: int, how many days/periods forward the parametric VaR should be calculated
+        :param lookback_periods: int, how many days/periods backward to condition the underlying distribution
+        :param key: string, corresponds to the market_data column to be calculated
+
+        :return: DataFrame indexed by position with weight, marginal_var, component_var, component_percent and incremental_var columns
+        """
+        variance, VaR = self.set_port_variance(
+            confidence_interval=confidence_interval,
+            var_horizon=var_horizon,
+            lookback_periods=lookback_periods,
+            key=key
+        )
+        weight_array = self.panel.weights
+        cov_mat = self.cov.values
+        cov_weights = cov_mat @ weight_array
+        # VaR is a multiple of the portfolio standard deviation, the same multiple scales every term
+        scale = VaR / np.sqrt(variance)
+        marginal = scale * cov_weights / np.sqrt(variance)
+        component = weight_array * marginal
+        remaining = variance - 2 * weight_array * cov_weights + weight_array ** 2 * np.diag(cov_mat)
+        incremental = VaR - scale * np.sqrt(np.clip(remaining, 0, None))
+        self.attribution = pd.DataFrame({
+            'weight': weight_array,
+            'marginal_var': marginal,
+            'component_var': component,
+            'component_percent': component / VaR,
+            'incremental_var': incremental
+        }, index=self.cov.index)
+        return self.attribution
+
+    def what_if(self, candidates, confidence_interval = norm.ppf(.025), var_horizon = 10, lookback_periods=0, key='percentchange', market_data=None):
+        """
+        Score a batch of hypothetical trades by the portfolio variance and VaR after each one, without changing the portfolio
+
+        Each candidate adds quantity * price to one position's value V_i, so with Cov * w and Cov_ii from the cached covariance the new variance is a rank-one update, (V ** 2 * Var + 2 * V * qp * (Cov * w)_i + qp ** 2 * Cov_ii) / (V + qp) ** 2, where V is the portfolio value. Candidates in tickers outside the portfolio need their market data to estimate their covariance with the current positions
+
+        :param candidates: DataFrame with key, quantity and price columns, or list of (key, quantity, price) tuples, key in the format of Portfolio.port keys such as 'AAPL Equity'
+        :param confidence_interval: float, The critical value to implement parametric VaR
+        :param var_horizon: int, how many days/periods forward the parametric VaR should be calculated
+        :param lookback_periods: int, how many days/periods backward to condition the underlying distribution
+        :param key: string, corresponds to the market_data column to be calculated
+        :param market_data: dict or None, key to market_data._StockData for candidates outside the portfolio
+
+        :return: DataFrame with a row per candidate, the key, quantity and price plus variance, value_at_risk and change_in_var after the trade
+        """
+        if not isinstance(candidates, pd.DataFrame):
+            candidates = pd.DataFrame(list(candidates), columns=['key', 'quantity', 'price'])
+        variance, VaR = self.set_port_variance(
+            confidence_interval=confidence_interval,
+            var_horizon=var_horizon,
+            lookback_periods=lookback_periods,
+            key=key
+        )
+        scale = VaR / np.sqrt(variance)
+        panel = self.panel
+        book = self.get_book()
+        total = (book.quantity * book.ordered_price).sum()
+        cov_mat = self.cov.values
+        cov_weights = cov_mat @ panel.weights
+
+        # (Cov * w)_i and Cov_ii for each candidate key, estimated from market data for new keys
+        cross = {column: (cov_weights[i], cov_mat[i, i]) for i, column in enumerate(panel.columns)}
+        for name in set(candidates['key']) - set(cross):
+            if market_data is None or name not in market_data:
+                raise Exception('Pass market_data for ' + name + ', it is not in the portfolio')
+            returns = market_data[name].market_data[key].reindex(panel.index).fillna(0).values
+            values = panel.values if lookback_periods == 0 else panel.values[-lookback_periods:]
+            returns = returns if lookback_periods == 0 else returns[-lookback_periods:]
+            joint = np.cov(np.column_stack([values, returns]), rowvar=False)
+            cross[name] = (joint[-1, :-1] @ panel.weights, joint[-1, -1])
+
+        trade_value = candidates['quantity'].values.astype(float) * candidates['price'].values.astype(float)
+        cov_weight, own_variance = np.array([cross[i] for i in candidates['key']]).T
+        new_variance = (
+            total ** 2 * variance
+            + 2 * total * trade_value * cov_weight
+            + trade_value ** 2 * own_variance
+        ) / (total + trade_value) ** 2
+        new_VaR = scale * np.sqrt(np.clip(new_variance, 0, None))
+        output = candidates.loc[:, ['key', 'quantity', 'price']].copy()
+        output['variance'] = new_variance
+        output['value_at_risk'] = new_VaR
+        output['change_in_var'] = new_VaR - VaR
+        return output
+
+    def stress_test(self, historical=None, hypothetical=None, window_length=None, factors=None, key='adj_close'):
+        """
+        Revalue the portfolio under historical and hypothetical scenarios, see stress.StressTest
+
+        :param historical: dict or None, scenario name to (start, end) dates
+        :param hypothetical: dict or None, scenario name to dict of ticker, position key or factor name to price return
+        :param window_length: int or None, if set include every historical window of this many periods
+        :param factors: DataFrame or None, factor loadings indexed by ticker or position key with a column per factor
+        :param key: string, market_data column of flat prices used for historical windows
+
+        :return: DataFrame of profit and loss, a row per scenario, a column per position and a total column, sorted from the worst total
+        """
+        self.stress = StressTest(self, key, factors)
+        self.stress_results = self.stress.run(historical, hypothetical, window_length)
+        return self.stress_results
+
+    def simulated_var_attribution(self, percentile=2.5, bandwidth=0.01):
+        """
+        Decompose simulated VaR by position from the output of .simulate_assets. Each position's component is its average profit and loss over the paths whose portfolio profit and loss is nearest the VaR percentile, so the components sum to the portfolio VaR estimated on the same paths
+
+        :param percentile: float, VaR percentile in percentage
+        :param bandwidth: float, share of paths around the VaR percentile to average over
+
+        :return: DataFrame indexed by position with quantity, marginal_var, component_var, component_percent and incremental_var columns, in profit and loss terms
+        """
+        try:
+            security_distribution = self.simulated_security_distribution
+        except AttributeError:
+            raise Exception('Must simulate the portfolio with .simulate_assets()')
+        values = security_distribution.values
+        portfolio = self.simulated_distribution
+        count = len(portfolio)
+        order = np.argsort(portfolio)
+        center = int(round(percentile / 100 * (count - 1)))
+        half = max(int(bandwidth * count) // 2, 1)
+        paths = order[max(center - half, 0):center + half + 1]
+        component = values[paths].mean(axis=0)
+        VaR = component.sum()
+        quantity = np.array([self.port[i].quantity for i in security_distribution.columns], dtype=float)
+        without = np.percentile(portfolio[:, None] - values, percentile, axis=0)
+        self.simulated_attribution = pd.DataFrame({
+            'quantity': quantity,
+            'marginal_var': component / quantity,
+            'component_var': component,
+            'component_percent': component / VaR,
+            'incremental_var': np.percentile(portfolio, percentile) - without
+        }, index=security_distribution.columns)
+        return self.simulated_attribution
+
+    def rolling_risk(self, window=250, decay=0.94, confidence=2.5, var_horizon=10, key='percentchange'):
+        """
+        Portfolio variance, parametric VaR, EWMA volatility and historic VaR at every date of the history, see rolling.RollingRiskEngine
+
+        :param window: int, number of observations in the rolling window
+        :param decay: float, EWMA decay
+        :param confidence: float, VaR percentile in percentage
+        :param var_horizon: int, how many days/periods forward VaR is calculated
+        :param key: string, corresponds to the market_data column of log returns
+
+        :return: DataFrame indexed by date with a column per series
+        """
+        panel = self.get_portfolio_panel(key)
+
+        def build():
+            engine = RollingRiskEngine(panel.values, panel.weights, window, decay, confidence, var_horizon)
+            return pd.DataFrame(engine.run(), index=panel.index)
+
+        self.rolling_risk_history = self.memoize(('rolling_risk', key, window, decay, confidence, var_horizon), build)
+        return self.rolling_risk_history
+
+    def backtest_var(self, model='parametric', window=250, var_horizon=1, confidence=2.5, key='percentchange', **kwargs):
+        """
+        Walk-forward backtest of a VaR model against the realized portfolio returns, see backtest.VaRBacktest
+
+        :param model: string, one of 'parametric', 'ewma', 'historic' or 'simulation'
+        :param window: int, number of observations each forecast uses
+        :param var_horizon: int, how many days/periods forward VaR is forecast and realized
+        :param confidence: float, VaR percentile in percentage
+        :param key: string, corresponds to the market_data column of log returns
+        :param kwargs: passed to the model, such as decay or number_of_simulations, executor and seed
+
+        :return: tuple, (DataFrame of forecast, realized and breach indexed by date, dict of statistics)
+        """
+        panel = self.get_portfolio_panel(key)
+        self.backtest = VaRBacktest(panel.values, panel.weights, panel.index, window, var_horizon, confidence)
+        self.backtest_results, self.backtest_statistics = self.backtest.run(model, **kwargs)
+        return self.backtest_results, self.backtest_statistics
+
     def historic_var(self, market_data=None, returns=True, key='adj_close', confidence=2.5, var_horizon=10):
         """
         Calulate Value at Risk from the historic distrubtion
@@ -423,22 +1138,75 @@ class Portfolio(object):
         :param confidence: float, percentile in percentage to pass into np.percentile
         :param var_horizon: int, how many days/periods forward the parametric VaR should be calculated
 
-        :return: tuple, (DataFrame, market_data, float, Historic VaR)
+        :return: tuple, (DataFrame, market_data changes for each position, its _port_weighted column and the portfolio, float, Historic VaR)
 
         """
         if market_data is None:
-            market_data = self.get_portfolio_marketdata(key)
+            market_data = self.memoize(
+                ('rolling', key, returns, var_horizon),
+                lambda: self.rolling_changes(None, returns, key, var_horizon)
+            )
+        else:
+            market_data = self.rolling_changes(market_data, returns, key, var_horizon)
 
+        self.historic_portfolio_value_at_risk = np.nanpercentile(market_data['portfolio'].values, confidence)
+        return market_data, self.historic_portfolio_value_at_risk
+
+    def rolling_changes(self, market_data=None, returns=True, key='adj_close', var_horizon=10):
+        """
+        Helper function to sum changes over rolling windows of var_horizon periods for each position, its _port_weighted column and the portfolio
+
+        :param market_data: DataFrame or None, the portfolio level market_data. Use if made external changes to the market_data
+        :param returns: Bool, True for compounded continuous returns, False for level changes
+        :param key: string, corresponds to the market_data column to be calculated
+        :param var_horizon: int, how many days/periods each window covers
+
+        :return: DataFrame of rolling changes in the layout of Portfolio.market_data
+        """
+        external = market_data is not None
+        market_data = self.get_panel_frame(market_data, key)
         if returns:
-            market_data = self.calculate_portfolio_returns(market_data)
+            market_data = pd.DataFrame(
+                self.get_frame_log_returns(market_data, key, external),
+                index=market_data.index,
+                columns=market_data.columns
+            )
             market_data = market_data.rolling(var_horizon).sum()
             market_data = np.exp(market_data) - 1
         else:
             market_data = market_data.diff(1)
             market_data = market_data.rolling(var_horizon).sum()
+        return market_data
+
+    def get_panel_frame(self, market_data=None, key='adj_close'):
+        """
+        Helper function to return the position, _port_weighted and portfolio columns of one DataFrame in the layout of Portfolio.market_data, built from the portfolio PricePanel
+
+        :param market_data: DataFrame or None, the portfolio level market_data. Use if made external changes to the market_data
+        :param key: string, corresponds to the market_data column to be used if market_data is None
 
-        self.historic_portfolio_value_at_risk = np.nanpercentile(market_data['portfolio'], confidence)
-        return market_data, np.nanpercentile(market_data['portfolio'], confidence)
+        :return: DataFrame with a column per position, a _port_weighted column per position and a portfolio column
+        """
+        if market_data is not None:
+            return PricePanel.from_frame(market_data, self.get_weights()).to_frame()
+        panel = self.get_portfolio_panel(key)
+        return self.memoize(('market_data', key), panel.to_frame)
+
+    def get_frame_log_returns(self, market_data, key='adj_close', external=False):
+        """
+        Helper function to return the log returns of every column of a frame from .get_panel_frame
+
+        :param market_data: DataFrame, the frame from .get_panel_frame
+        :param key: string, corresponds to the market_data column the frame was built from
+        :param external: bool, True if the frame was built from market_data passed in rather than the memoized panel
+
+        :return: numpy.array of the same shape as market_data, the first row is NaN
+        """
+        if external:
+            return PricePanel.log_returns(market_data.values)
+        changes = self.get_log_returns(key)
+        # Weighted columns have the same log returns as the unweighted ones
+        return np.column_stack([changes[:, :-1], changes])
 
     def drawdown(self, market_data=None, returns=True, key='adj_close'):
         """
@@ -448,13 +1216,17 @@ class Portfolio(object):
         :param returns: Bool, True if calculate DD based on continuous returns, False if on level prices
         :param key: string, corresponds to the market_data column to be calculated
 
-        :return: DataFrame representing the Draw Down for the portfolio and components
+        :return: DataFrame representing the Draw Down for the portfolio and components, in the layout of Portfolio.market_data
 
         """
-        if market_data is None:
-            market_data = self.get_portfolio_marketdata(key)
+        external = market_data is not None
+        market_data = self.get_panel_frame(market_data, key)
         if returns:
-            market_data = self.calculate_portfolio_returns(market_data)
+            market_data = pd.DataFrame(
+                self.get_frame_log_returns(market_data, key, external),
+                index=market_data.index,
+                columns=market_data.columns
+            )
             market_data = market_data.cumsum() - market_data.cumsum().cummax()
             market_data = np.exp(market_data)
         else:
@@ -463,12 +1235,13 @@ class Portfolio(object):
 
 
 
-    def construct_portfolio_csv(self, data_input, apikey):
+    def construct_portfolio_csv(self, data_input, apikey, cache=None):
         """
         Built in portfolio constructor method
 
         :param data_input: either pandas DataFrame or string path to a portfolio matching './portfolio_example.csv'
         :param apikey: ApiKey for the market data object
+        :param cache: market_data.MarketDataCache or None, local cache to serve and store the raw market data
 
         :return: dict for self.port
 
@@ -484,33 +1257,135 @@ class Portfolio(object):
             self.port = None
             return(self.port)
 
+        if (~portfolio_data['Type'].isin(['Equity', 'Option'])).any():
+            print('Type of security not defined!')
+            self.port = None
+            return(self.port)
+        if (portfolio_data['Type'] == 'Option').any() and not {'Strike', 'Expiry', 'Option Type'}.issubset(portfolio_data.columns):
+            raise Exception('Option rows need Strike, Expiry and Option Type (Call or Put) columns')
+
+        loaded, self.load_report = md.load_bulk(apikey, portfolio_data['Ticker'], days=80, cache=cache)
+        failed = [ticker for ticker in portfolio_data['Ticker'].unique() if ticker not in loaded]
+        if failed:
+            raise Exception('Market data could not be loaded for: ' + ', '.join(failed))
+
         for i in portfolio_data.index:
-            if portfolio_data.loc[i, 'Type'] == 'Equity':
-                tempdata = md.QuandlStockData(apikey, portfolio_data.loc[i, 'Ticker'], days=80)
+            if portfolio_data.loc[i, 'Type'] == 'Option':
+                tempsecurity = Option(
+                    portfolio_data.loc[i, 'Ticker'],
+                    loaded[portfolio_data.loc[i, 'Ticker']],
+                    ordered_price = portfolio_data.loc[i, 'Ordered Price'],
+                    quantity = portfolio_data.loc[i, 'Quantity'],
+                    date_ordered=portfolio_data.loc[i, 'Ordered Date'],
+                    strike = portfolio_data.loc[i, 'Strike'],
+                    expiry = portfolio_data.loc[i, 'Expiry'],
+                    call = str(portfolio_data.loc[i, 'Option Type']).lower().startswith('c')
+                )
+            else:
                 tempsecurity = Equity(
                     portfolio_data.loc[i, 'Ticker'],
-                    tempdata,
+                    loaded[portfolio_data.loc[i, 'Ticker']],
                     ordered_price = portfolio_data.loc[i, 'Ordered Price'],
                     quantity = portfolio_data.loc[i, 'Quantity'],
                     date_ordered=portfolio_data.loc[i, 'Ordered Date']
                 )
-                assets.append(tempsecurity)
-            else:
-                print('Type of security not defined!')
-                self.port = None
-                return(self.port)
+            assets.append(tempsecurity)
         self.port = {asset.name + ' ' + asset.type : asset for asset in assets}
         return self.port
 
-    def simulate(self, SimulationGenerator, periods_forward, number_of_simulations):
+    def simulate(self, SimulationGenerator, periods_forward, number_of_simulations, chunk_size=None, executor=None, seed=None):
         """
         Primary function to simulate the entire portfolio
+
+        :param SimulationGenerator: simgen._Simulation, the simulation to run
+        :param periods_forward: int, how many steps into the future to simulate
+        :param number_of_simulations: int, how many paths to simulate
+        :param chunk_size: int or None, if set, or if executor or seed is set, run SimulationGenerator.simulate_chunked in blocks of this many paths and do not keep all_sims
+        :param executor: concurrent.futures.Executor or None, executor to spread path blocks across
+        :param seed: int or None, master seed for reproducible per block random draws
+
+        :return: tuple, (np.array simulation_mean, np.array simulation_std)
         """
 
-        self.all_sims = SimulationGenerator.simulate(periods_forward, number_of_simulations)
+        if chunk_size or executor is not None or seed is not None:
+            SimulationGenerator.simulate_chunked(
+                periods_forward,
+                number_of_simulations,
+                chunk_size=chunk_size or 10000,
+                executor=executor,
+                seed=seed
+            )
+            self.all_sims = None
+        else:
+            self.all_sims = SimulationGenerator.simulate(periods_forward, number_of_simulations)
         self.simulation_mean = SimulationGenerator.simulation_mean
         self.simulation_std = SimulationGenerator.simulation_std
         self.simulated_distribution = SimulationGenerator.simulated_distribution
+        self.simulation_summary = SimulationGenerator.summary
 
         return self.simulation_mean, self.simulation_std
 
+    def simulate_assets(self, periods_forward, number_of_simulations, Generator=None, chunk_size=1000, seed=None, lookback_periods=0, key='percentchange'):
+        """
+        Simulate every security in the portfolio jointly and revalue each position on every path, keeping correlations between holdings
+
+        Paths are generated as one (paths, steps, assets) block per chunk, each security's simulated prices are passed through its valuation method in vectorized form, and only the moments by step and the terminal profit and loss are kept, so memory is bounded by chunk_size
+
+        :param periods_forward: int, how many steps into the future to simulate
+        :param number_of_simulations: int, how many paths to simulate
+        :param Generator: simgen._RandomGen or None, a generator whose generate_matrix returns (paths, steps, assets) log returns ordered like self.cov. If None, a simgen.MultivariateNormalDistribution is built from the portfolio means and covariance
+        :param chunk_size: int, default 1000, how many paths are generated at once
+        :param seed: int or None, master seed for reproducible per chunk random draws
+        :param lookback_periods: int, how many days/periods backward to condition the underlying distribution
+        :param key: string, corresponds to the market_data column of log returns
+
+        :return: tuple, (np.array portfolio profit and loss mean by step, np.array portfolio profit and loss std by step)
+        """
+        self.set_port_variance(lookback_periods=lookback_periods, key=key)
+        order = list(self.cov.columns)
+        if Generator is None:
+            returns = self.panel.values if lookback_periods == 0 else self.panel.values[-lookback_periods:]
+            Generator = mc.MultivariateNormalDistribution(returns.mean(axis=0), self.cov.values)
+        walk = mc.NaiveMonteCarlo(Generator)
+
+        securities = [self.port[i] for i in order]
+        current_prices = np.array([security.market_data.current_price() for security in securities])
+        current_values = np.array([security.valuation(price) for security, price in zip(securities, current_prices)])
+        steps = np.arange(1, periods_forward + 1)
+
+        block_sizes = [
+            min(chunk_size, number_of_simulations - start)
+            for start in range(0, number_of_simulations, chunk_size)
+        ]
+        if seed is None:
+            seeds = [None] * len(block_sizes)
+        else:
+            seeds = np.random.SeedSequence(seed).spawn(len(block_sizes))
+
+        moments = mc.RunningMoments()
+        security_distribution = np.empty((number_of_simulations, len(order)))
+        start = 0
+        for size, block_seed in zip(block_sizes, seeds):
+            random_state = None if block_seed is None else np.random.default_rng(block_seed)
+            prices = walk.generate_paths(periods_forward, size, random_state=random_state)
+            np.exp(prices, out=prices)
+            prices *= current_prices
+            profit = np.empty(prices.shape)
+            for j, security in enumerate(securities):
+                if isinstance(security, Option):
+                    # Options lose time value along each path
+                    profit[..., j] = security.valuation(prices[..., j], days_forward=steps) - current_values[j]
+                else:
+                    profit[..., j] = security.valuation(prices[..., j]) - current_values[j]
+            moments.update(profit.sum(axis=2))
+            security_distribution[start:start + size] = profit[:, -1, :]
+            start += size
+
+        self.simulation_mean = moments.mean
+        self.simulation_std = moments.std()
+        self.simulated_security_distribution = pd.DataFrame(security_distribution, columns=order)
+        self.simulated_distribution = security_distribution.sum(axis=1)
+        self.simulation_summary = mc.summarize(self.simulated_distribution)
+        self.all_sims = None
+
+        return self.simulation_mean, self.simulation_std
@@ -1,7 +1,157 @@
+import copy
+from itertools import repeat
+
 import pandas as pd
 import numpy as np
+from scipy.optimize import minimize
+from scipy.signal import lfilter
+from scipy.special import ndtri
 from . import market_data
-from statsmodels.tsa.arima_model import ARMA
+
+
+def get_random_state(random_state=None):
+    """
+    Helper function to resolve the source of random draws. None uses the global numpy.random state, otherwise the given numpy.random.Generator is used
+
+    :param random_state: numpy.random.Generator or None
+
+    :return: numpy.random.Generator or the numpy.random module
+    """
+    if random_state is None:
+        return np.random
+    return random_state
+
+def weighted_percentile(values, weights, percentile):
+    """
+    Percentile of values where each value carries a weight, such as control variate weights that sum to 1 and may be negative
+
+    :param values: list-like float, the values
+    :param weights: list-like float, the weight of each value
+    :param percentile: float, percentile in percentage
+
+    :return: float, the smallest value whose cumulative weight reaches percentile / 100
+    """
+    values = np.asarray(values)
+    order = np.argsort(values)
+    # Negative weights can make the cumulative weight fall back, its running maximum keeps it sorted for searchsorted
+    cumulative = np.maximum.accumulate(np.cumsum(np.asarray(weights)[order]))
+    position = min(np.searchsorted(cumulative, percentile / 100), len(values) - 1)
+    return values[order][position]
+
+
+def summarize(values, bins=50, percentiles=(0.5, 1, 2.5, 5, 10, 25, 50, 75, 90, 95, 97.5, 99, 99.5), range=None):
+    """
+    Compact summary of a simulated distribution, a fixed bin histogram, a quantile table and moments, so dashboards can chart and tabulate it without the raw samples. The summary's size depends on bins and percentiles, not on the number of samples, and non finite values are left out
+
+    :param values: list-like float, the samples, such as simulated terminal values
+    :param bins: int or list-like float, number of equal width bins, or the bin edges
+    :param percentiles: list-like float, percentiles in percentage for the quantile table
+    :param range: tuple or None, (lower, upper) limits of the bins, None uses the smallest and largest value
+
+    :return: dict of string to numpy.array, bin_edges, counts, probabilities, percentiles, quantiles, count, mean, std, skewness, kurtosis, minimum and maximum
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    values = values[np.isfinite(values)]
+    percentiles = np.asarray(percentiles, dtype=float)
+    count = len(values)
+    if count == 0:
+        edges = np.histogram_bin_edges([], bins, range)
+        return {
+            'bin_edges': edges,
+            'counts': np.zeros(len(edges) - 1, dtype=np.int64),
+            'probabilities': np.zeros(len(edges) - 1),
+            'percentiles': percentiles,
+            'quantiles': np.full(len(percentiles), np.nan),
+            'count': np.array(0),
+            'mean': np.array(np.nan),
+            'std': np.array(np.nan),
+            'skewness': np.array(np.nan),
+            'kurtosis': np.array(np.nan),
+            'minimum': np.array(np.nan),
+            'maximum': np.array(np.nan)
+        }
+    counts, edges = np.histogram(values, bins, range)
+    mean = values.mean()
+    centered = values - mean
+    variance = np.square(centered).mean()
+    if variance > 0:
+        skewness = (centered ** 3).mean() / variance ** 1.5
+        kurtosis = (centered ** 4).mean() / variance ** 2 - 3
+    else:
+        skewness = kurtosis = np.nan
+    return {
+        'bin_edges': edges,
+        'counts': counts,
+        'probabilities': counts / count,
+        'percentiles': percentiles,
+        'quantiles': np.percentile(values, percentiles),
+        'count': np.array(count),
+        'mean': np.array(mean),
+        'std': np.array(np.sqrt(variance)),
+        'skewness': np.array(skewness),
+        'kurtosis': np.array(kurtosis),
+        'minimum': np.array(values.min()),
+        'maximum': np.array(values.max())
+    }
+
+
+def halton(points, dimensions, random_state=None):
+    """
+    Halton low discrepancy points in [0, 1) ** dimensions, each dimension the radical inverse of the point number in the next prime base, randomized by one uniform shift per dimension so independent blocks stay unbiased
+
+    :param points: int, number of points
+    :param dimensions: int, number of dimensions
+    :param random_state: numpy.random.Generator or None, source of the random shift, None uses the global numpy.random state
+
+    :return: np.array of shape (points, dimensions)
+    """
+    bases = []
+    candidate = 2
+    while len(bases) < dimensions:
+        if all(candidate % base for base in bases):
+            bases.append(candidate)
+        candidate += 1
+    # Built one dimension per row so every update is on contiguous memory
+    output = np.zeros((dimensions, points))
+    for row, base in enumerate(bases):
+        number = np.arange(1, points + 1)
+        fraction = 1 / base
+        while number.any():
+            number, digit = np.divmod(number, base)
+            output[row] += digit * fraction
+            fraction /= base
+    output += get_random_state(random_state).random(dimensions)[:, None]
+    return (output % 1).T
+
+
+def brownian_bridge(draws):
+    """
+    Turn independent standard normals into independent standard normal steps of a random walk, built with a Brownian bridge so the first column sets the end point, the next the midpoint, and so on. Quasi-random points are most even in their first dimensions, so this puts them where they matter most for the terminal value
+
+    :param draws: np.array of shape (paths, steps), independent standard normals
+
+    :return: np.array of shape (paths, steps), independent standard normal steps
+    """
+    paths, steps = draws.shape
+    # Built one step per row so every update is on contiguous memory
+    draws = np.ascontiguousarray(draws.T)
+    walk = np.zeros((steps + 1, paths))
+    walk[steps] = np.sqrt(steps) * draws[0]
+    row = 1
+    intervals = [(0, steps)]
+    while intervals:
+        left, right = intervals.pop(0)
+        if right - left < 2:
+            continue
+        middle = (left + right) // 2
+        walk[middle] = (
+            ((right - middle) * walk[left] + (middle - left) * walk[right]) / (right - left)
+            + np.sqrt((middle - left) * (right - middle) / (right - left)) * draws[row]
+        )
+        row += 1
+        intervals += [(left, middle), (middle, right)]
+    return np.diff(walk, axis=0).T
+
 
 class _RandomGen():
 
@@ -23,6 +173,78 @@ class _RandomGen():
         """
         raise NotImplementedError()
 
+    def generate_matrix(self, paths, steps, random_state=None, **kwargs):
+        """
+        Function to generate a full (paths, steps) block of random values in one call. Subclasses should override this with a single batched draw, the default stacks one .generate call per path
+
+        :param paths: int, number of independent paths, the rows of the returned array
+        :param steps: int, number of values per path, the columns of the returned array
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+        :param kwargs: dict, any additional arguments the subclass' .generate requires
+
+        :return: numpy.array of shape (paths, steps)
+        """
+        return np.array([self.generate(steps, random_state=random_state, **kwargs) for i in range(paths)])
+
+
+class RunningMoments():
+
+    """
+    Accumulates the count, mean and sum of squared deviations of blocks of simulated paths, so the mean and standard deviation by step can be computed without holding every path in memory
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, block):
+        """
+        Function to add a block of paths to the running moments
+
+        :param block: numpy.array of shape (paths, steps), each row is an independent path
+        """
+        self.merge(*self.block_moments(block))
+
+    @staticmethod
+    def block_moments(block):
+        """
+        Function to compute the moments of a single block of paths, in the form accepted by .merge
+
+        :param block: numpy.array of shape (paths, steps)
+
+        :return: tuple, (int count, numpy.array mean, numpy.array sum of squared deviations)
+        """
+        block_mean = block.mean(axis=0)
+        block_m2 = np.square(block - block_mean).sum(axis=0)
+        return block.shape[0], block_mean, block_m2
+
+    def merge(self, count, mean, m2):
+        """
+        Function to combine the moments of another set of paths with the running moments
+
+        :param count: int, number of paths the moments were computed over
+        :param mean: numpy.array, mean by step of those paths
+        :param m2: numpy.array, sum of squared deviations from the mean by step of those paths
+        """
+        if self.count == 0:
+            self.count, self.mean, self.m2 = count, mean, m2
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + np.square(delta) * (self.count * count / total)
+        self.count = total
+
+    def std(self):
+        """
+        Function to return the population standard deviation by step, matching numpy.std with ddof=0
+
+        :return: numpy.array, standard deviation by step
+        """
+        return np.sqrt(self.m2 / self.count)
+
+
 class _Simulation():
 
     """
@@ -45,43 +267,268 @@ class _Simulation():
         :param percentile: float, default 2.5, represents the Value at Risk, as defined by a certain percentile, for a simulation
 
         """
-        self.percentilevar = np.percentile(self.simulated_distribution, percentile, axis=0)
+        weights = self.control_weights()
+        if weights is None:
+            self.percentilevar = np.percentile(self.simulated_distribution, percentile, axis=0)
+        else:
+            self.percentilevar = weighted_percentile(self.simulated_distribution, weights, percentile)
+
+    def control_weights(self):
+        """
+        Weights for each simulated terminal value that apply control variates to .set_var. Subclasses with analytic moments implement this, None weights every path equally
+
+        :return: np.array of shape (number_of_simulations,) or None
+        """
+        return None
+
+    def generate_paths(self, periods_forward, number_of_simulations, random_state=None):
+        """
+        Function to generate a block of simulated paths. Subclasses implement this to support .simulate_chunked
+
+        :param periods_forward: int, how many steps into the future each path will take
+        :param number_of_simulations: int, how many paths to generate in this block
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: np.array of shape (number_of_simulations, periods_forward)
+        """
+        raise NotImplementedError()
+
+    def set_statistics(self, simulations):
+        """
+        Helper function to set simulation_mean, simulation_std, simulated_distribution and summary from a full set of paths
+
+        :param simulations: np.array of shape (number_of_simulations, periods_forward)
+        """
+        self.simulation_mean = simulations.mean(axis=0)
+        self.simulation_std = simulations.std(axis=0)
+        self.simulated_distribution = simulations[:, -1]
+        self.set_summary()
+
+    def set_summary(self, bins=50, **kwargs):
+        """
+        Helper function to set summary, a compact histogram, quantile table and moments of simulated_distribution, see summarize. Called at the end of every simulation with the defaults, call again to change the bins
+
+        :param bins: int or list-like float, number of equal width bins, or the bin edges
+        :param kwargs: dict, percentiles or range, passed to summarize
+
+        :return: dict of string to numpy.array
+        """
+        self.summary = summarize(self.simulated_distribution, bins, **kwargs)
+        return self.summary
 
     def simulate(self, number_of_simulations):
         pass
 
+    def simulate_chunked(self, periods_forward, number_of_simulations, chunk_size=10000, percentile=2.5, executor=None, seed=None):
+        """
+        Function to run the simulation in blocks of paths, keeping running moments by step and the terminal values instead of the full path matrix. Peak memory depends on chunk_size rather than number_of_simulations
+
+        Blocks can be spread across a concurrent.futures.Executor, such as a ProcessPoolExecutor. When a seed is given, or an executor is used, every block draws from its own numpy.random.Generator spawned from one numpy.random.SeedSequence, and blocks are merged in order, so a fixed seed gives identical results for any number of workers
+
+        :param periods_forward: int, how many steps into the future each path will take
+        :param number_of_simulations: int, how many separate independent paths will be simulated
+        :param chunk_size: int, default 10000, how many paths are generated at once
+        :param percentile: float, default 2.5, percentile passed to .set_var once the simulation is complete
+        :param executor: concurrent.futures.Executor or None, if set, blocks are simulated with executor.map
+        :param seed: int, numpy.random.SeedSequence or None, master seed for the per block Generators
+
+        :return: tuple, (np.array simulation_mean, np.array simulation_std)
+        """
+        block_sizes = [
+            min(chunk_size, number_of_simulations - start)
+            for start in range(0, number_of_simulations, chunk_size)
+        ]
+        if seed is None and executor is None:
+            seeds = [None] * len(block_sizes)
+        else:
+            seeds = np.random.SeedSequence(seed).spawn(len(block_sizes))
+
+        if executor is None:
+            blocks = map(simulate_block, repeat(self), repeat(periods_forward), block_sizes, seeds)
+        else:
+            # Workers only need the simulation parameters, not results of earlier runs
+            worker = copy.copy(self)
+            for name in ('simulation_mean', 'simulation_std', 'simulated_distribution', 'percentilevar', 'summary'):
+                worker.__dict__.pop(name, None)
+            blocks = executor.map(simulate_block, repeat(worker), repeat(periods_forward), block_sizes, seeds)
+
+        moments = RunningMoments()
+        distribution = None
+        start = 0
+        for count, mean, m2, terminal in blocks:
+            moments.merge(count, mean, m2)
+            if distribution is None:
+                distribution = np.empty(number_of_simulations, dtype=terminal.dtype)
+            distribution[start:start + count] = terminal
+            start += count
+
+        self.simulation_mean = moments.mean
+        self.simulation_std = moments.std()
+        self.simulated_distribution = distribution
+        self.set_var(percentile)
+        self.set_summary()
+
+        return self.simulation_mean, self.simulation_std
+
+
+def simulate_block(simulation, periods_forward, number_of_simulations, seed=None):
+    """
+    Function to simulate one block of paths and reduce it to its moments and terminal values. Defined at module level so it can be sent to a process pool
+
+    :param simulation: _Simulation, the simulation whose .generate_paths is called
+    :param periods_forward: int, how many steps into the future each path will take
+    :param number_of_simulations: int, how many paths are in the block
+    :param seed: numpy.random.SeedSequence or None, seed for the block's Generator, None uses the global numpy.random state
+
+    :return: tuple, (int count, np.array mean, np.array sum of squared deviations, np.array terminal values)
+    """
+    random_state = None if seed is None else np.random.default_rng(seed)
+    simulations = simulation.generate_paths(periods_forward, number_of_simulations, random_state=random_state)
+    count, mean, m2 = RunningMoments.block_moments(simulations)
+    return count, mean, m2, simulations[:, -1].copy()
+
 
 class NormalDistribution(_RandomGen):
     """
     A _RandomGen object that represents a normal/Gaussian. See [numpy documentation](https://numpy.org/doc/stable/reference/random/generated/numpy.random.normal.html) for more detail
 
+    Variance reduction is optional. sampling='halton' or 'sobol' maps randomized low discrepancy points through the normal inverse CDF, with each path a point whose dimensions are the steps laid out by a Brownian bridge, 'sobol' needs scipy.stats.qmc from scipy 1.7. antithetic=True pairs every path with its mirror image around the location
+
     :param location: float, the mean/center of the distribution
     :param scale: float, the standard deviation of the distribution. Must be non-negative.
+    :param sampling: string, default 'pseudo', one of 'pseudo', 'halton' or 'sobol'
+    :param antithetic: bool, default False, if True half the paths are the antithetic copies of the other half
     """
 
-    def __init__(self, location, scale):
+    SAMPLING = ('pseudo', 'halton', 'sobol')
+
+    def __init__(self, location, scale, sampling='pseudo', antithetic=False):
+        if sampling not in self.SAMPLING:
+            raise Exception('sampling must be one of ' + ', '.join(self.SAMPLING))
         self.args = {
             'location': location,
             'scale': scale
         }
+        self.sampling = sampling
+        self.antithetic = antithetic
+
+    def moments(self, steps):
+        """
+        Analytic mean and standard deviation of the sum of steps draws
+
+        :param steps: int, number of draws summed
 
-    def generate(self, obs):
+        :return: tuple, (float mean, float standard deviation)
+        """
+        return steps * self.args['location'], np.sqrt(steps) * self.args['scale']
+
+    def generate(self, obs, random_state=None):
         """
         Function to return a numpy.array of parametrically defined normally distributed random values
 
         :param obs: int, number of values to be generated
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
 
         :return: numpy.array of numpy.float, represents a collection of randomly distributed values
         """
-        return(np.random.normal(self.args['location'], self.args['scale'], obs))
+        if self.sampling == 'pseudo' and not self.antithetic:
+            return(get_random_state(random_state).normal(self.args['location'], self.args['scale'], obs))
+        return self.generate_matrix(obs, 1, random_state)[:, 0]
+
+    def standard_normal(self, paths, steps, random_state=None):
+        """
+        Function to return standard normal draws with the chosen sampling, quasi-random draws are arranged along each path with a Brownian bridge
+
+        :param paths: int, number of paths
+        :param steps: int, number of values per path
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: numpy.array of shape (paths, steps)
+        """
+        if self.sampling == 'pseudo':
+            return get_random_state(random_state).standard_normal((paths, steps))
+        if self.sampling == 'halton':
+            uniform = halton(paths, steps, random_state)
+        else:
+            try:
+                from scipy.stats import qmc
+            except ImportError:
+                raise Exception("sampling='sobol' requires scipy>=1.7")
+            # Draw the scramble seed from the global state so np.random.seed makes Sobol reproducible like the other samplers
+            seed = np.random.randint(2 ** 31) if random_state is None else random_state
+            uniform = qmc.Sobol(steps, scramble=True, seed=seed).random(paths)
+        return brownian_bridge(ndtri(np.clip(uniform, 1e-12, 1 - 1e-12)))
+
+    def generate_matrix(self, paths, steps, random_state=None):
+        """
+        Function to return a numpy.array of normally distributed random values for every path and step in one draw
+
+        :param paths: int, number of independent paths
+        :param steps: int, number of values per path
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: numpy.array of shape (paths, steps)
+        """
+        if self.sampling == 'pseudo' and not self.antithetic:
+            return(get_random_state(random_state).normal(self.args['location'], self.args['scale'], (paths, steps)))
+        if self.antithetic:
+            draws = self.standard_normal(-(-paths // 2), steps, random_state)
+            draws = np.concatenate([draws, -draws])[:paths]
+        else:
+            draws = self.standard_normal(paths, steps, random_state)
+        draws *= self.args['scale']
+        draws += self.args['location']
+        return draws
 
 
 class NaiveMonteCarlo(_Simulation):
 
     """
     A _Simulation object to create a Naive Monte Carlo simulation of a Random Walk, with each step being i.i.d. given the _RandomGen RV Generator class
+
+    Pass control_variate=True to estimate VaR with control variates, when the Generator has analytic moments like NormalDistribution. The terminal log return and the terminal gross return, whose normal and lognormal means are known, weight the paths in .set_var
+
+    :param Generator: _RandomGen, the RV distribution for each step
+    :param control_variate: bool, default False, if True .set_var uses control variate weights
     """
 
+    def control_weights(self):
+        """
+        Control variate weights for the terminal values. With controls C of known mean mu, each path gets (1 - (C - mean(C)) * inverse(Cov(C)) * (mean(C) - mu)) / number_of_simulations, the weights of the regression estimator of the distribution function
+
+        :return: np.array of shape (number_of_simulations,) or None
+        """
+        if not self.args.get('control_variate'):
+            return None
+        try:
+            mean, std = self.Generator.moments(len(self.simulation_mean))
+        except AttributeError:
+            raise Exception('control_variate requires a Generator with analytic moments, such as NormalDistribution')
+        terminal = self.simulated_distribution
+        controls = np.column_stack([terminal, np.exp(terminal)])
+        expected = np.array([mean, np.exp(mean + std ** 2 / 2)])
+        centered = controls - controls.mean(axis=0)
+        covariance = centered.T @ centered / len(terminal)
+        coefficients = np.linalg.lstsq(covariance, controls.mean(axis=0) - expected, rcond=None)[0]
+        return (1 - centered @ coefficients) / len(terminal)
+
+    def generate_paths(self, periods_forward, number_of_simulations, random_state=None):
+        """
+        Function to generate a block of independent random walks
+
+        :param periods_forward: int, how many steps into the future each random walk will take
+        :param number_of_simulations: int, how many separate independent paths will be generated
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: np.array of shape (number_of_simulations, periods_forward), each row is an independent simulation, each column is a time period step
+        """
+        simulations = self.Generator.generate_matrix(number_of_simulations, periods_forward, random_state=random_state)
+
+        # Cumulate each path along the time axis without allocating a second array
+        simulations.cumsum(axis=1, out=simulations)
+
+        return(simulations)
+
     def simulate(self, periods_forward, number_of_simulations):
         """
         Function to simulate each independent walk in the Monte Carlo simulation
@@ -89,55 +536,295 @@ class NaiveMonteCarlo(_Simulation):
         :param periods_forward: int, how many steps into the future each random simulated random walk will take
         :param number_of_simulations: int, how many separate independent paths will be simulated
 
-        :return: np.array of shape (periods_forward, number_of_simulations), each row is an independent simulation, each column is a time period step
+        :return: np.array of shape (number_of_simulations, periods_forward), each row is an independent simulation, each column is a time period step
         """
-        simulations = [self.Generator.generate(periods_forward) for i in range(number_of_simulations)]
+        simulations = self.generate_paths(periods_forward, number_of_simulations)
+
+        self.set_statistics(simulations)
 
-        simulations = [simulation.cumsum() for simulation in simulations]
+        return(simulations)
 
-        simulations = np.array(simulations)
 
-        self.simulation_mean = simulations.mean(axis=0)
 
-        self.simulation_std = simulations.std(axis=0)
+class MultivariateNormalDistribution(_RandomGen):
+    """
+    A _RandomGen object that represents a joint normal distribution across several assets. Correlated draws are made by multiplying independent standard normals by a factor of the covariance matrix, the Cholesky factor when the matrix is positive definite, otherwise an eigen factor with negative eigenvalues clipped to zero
 
-        self.simulated_distribution = simulations[:, -1]
+    :param location: list-like float, the mean of each asset
+    :param covariance: 2-D list-like float, the covariance matrix of the assets
+    """
 
-        return(simulations)
+    def __init__(self, location, covariance):
+        location = np.asarray(location, dtype=float)
+        covariance = np.asarray(covariance, dtype=float)
+        self.args = {
+            'location': location,
+            'covariance': covariance
+        }
+        try:
+            self.factor = np.linalg.cholesky(covariance)
+        except np.linalg.LinAlgError:
+            eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+            self.factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+    def generate(self, obs, random_state=None):
+        """
+        Function to return correlated normally distributed random values for each asset
+
+        :param obs: int, number of joint values to be generated
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: numpy.array of shape (obs, assets)
+        """
+        return self.generate_matrix(1, obs, random_state=random_state)[0]
+
+    def generate_matrix(self, paths, steps, random_state=None):
+        """
+        Function to return correlated normally distributed random values for every path, step and asset in one draw
 
+        :param paths: int, number of independent paths
+        :param steps: int, number of values per path
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: numpy.array of shape (paths, steps, assets)
+        """
+        shocks = get_random_state(random_state).standard_normal((paths, steps, self.factor.shape[0]))
+        shocks = np.matmul(shocks, self.factor.T)
+        shocks += self.args['location']
+        return shocks
 
 
 class HistoricPull(_RandomGen):
 
     """
-    A _RandomGen object that represents a uniformly distributed selection from a given set of historic observations
+    A _RandomGen object that resamples historic observations. Every draw first builds a (paths, steps) matrix of row indices into the observations in one shot, then gathers the rows, so multi asset observations of shape (dates, assets) are sampled on the same dates and keep their joint dependence
+
+    Sampling methods are 'iid', uniform independent dates, 'block', the moving block bootstrap of consecutive dates, and 'stationary', the stationary bootstrap where blocks have geometric lengths with mean block_size. Block methods keep volatility clustering within each block
+
+    For a whole portfolio pass the percentchange panel, for example HistoricPull(portfolio.get_portfolio_panel('percentchange').values), as the Generator of Portfolio.simulate_assets
+
+    :param historic_observations: list-like float or None, the observations of shape (dates,) or (dates, assets) to pull from, can also be passed on each draw
+    :param method: string, default 'iid', one of 'iid', 'block' or 'stationary'
+    :param block_size: int, default 20, the block length, or mean block length for 'stationary'
     """
 
-    def generate(self, obs, historic_observations):
+    METHODS = ('iid', 'block', 'stationary')
+
+    def __init__(self, historic_observations=None, method='iid', block_size=20):
+        if method not in self.METHODS:
+            raise Exception('method must be one of ' + ', '.join(self.METHODS))
+        self.method = method
+        self.block_size = block_size
+        self.historic_observations = None
+        if historic_observations is not None:
+            self.historic_observations = np.ascontiguousarray(historic_observations, dtype=float)
+        self.args = {
+            'method': method,
+            'block_size': block_size
+        }
+
+    @classmethod
+    def from_market_data(cls, data, key='percentchange', **kwargs):
+        """
+        Build the generator from a market data object's log returns
+
+        :param data: market_data._StockData, the market data to pull from
+        :param key: string, default 'percentchange', the market_data column of log returns
+        :param kwargs: passed to HistoricPull, such as method and block_size
+
+        :return: HistoricPull
+        """
+        # The first percentchange is filled with 0 rather than observed
+        return cls(data.market_data[key].values[1:], **kwargs)
+
+    def indices(self, paths, steps, length, random_state=None):
+        """
+        Function to draw the matrix of row indices for every path and step
+
+        :param paths: int, number of independent paths
+        :param steps: int, number of observations per path
+        :param length: int, number of historic observations
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: np.array of int of shape (paths, steps)
+        """
+        random_state = get_random_state(random_state)
+        integers = random_state.integers if hasattr(random_state, 'integers') else random_state.randint
+        if self.method == 'iid':
+            return integers(0, length, (paths, steps))
+        block_size = min(self.block_size, length)
+        if self.method == 'block':
+            blocks = -(-steps // block_size)
+            starts = integers(0, length - block_size + 1, (paths, blocks))
+            output = starts[:, :, None] + np.arange(block_size)
+            return output.reshape(paths, blocks * block_size)[:, :steps]
+        # Stationary bootstrap, each step starts a new block with probability 1 / block_size, otherwise continues from the last start, wrapping around the end of the history
+        new_block = random_state.random((paths, steps)) < 1 / block_size
+        new_block[:, 0] = True
+        position = np.arange(steps)
+        last_start = np.maximum.accumulate(np.where(new_block, position, 0), axis=1)
+        starts = integers(0, length, (paths, steps))
+        output = np.take_along_axis(starts, last_start, axis=1) + position - last_start
+        return output % length
+
+    def observations(self, historic_observations=None):
         """
-        Function to return a numpy.array of randomly and uniformly selected values from the given historic observations
+        Helper function to return the observations to pull from
+
+        :param historic_observations: list-like float or None, None uses the observations given on creation
+
+        :return: np.array
+        """
+        if historic_observations is None:
+            if self.historic_observations is None:
+                raise Exception('Pass historic_observations on creation or on each draw')
+            return self.historic_observations
+        return np.asarray(historic_observations)
+
+    def generate(self, obs, historic_observations=None, random_state=None):
+        """
+        Function to return a numpy.array of selected values from the given historic observations
 
         :param obs: int, number of observations to pull
-        :param historic_observations: list-like float, the collection of historic observations to pull from
+        :param historic_observations: list-like float or None, the collection of historic observations to pull from, None uses the observations given on creation
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: np.array of shape (obs,), or (obs, assets) for multi asset observations
+        """
+        return self.generate_matrix(1, obs, historic_observations, random_state)[0]
 
-        :return: np.array of selected historic observations
+    def generate_matrix(self, paths, steps, historic_observations=None, random_state=None):
         """
-        return np.random.choice(historic_observations, obs)
+        Function to return a numpy.array of selected historic observations for every path and step in one draw
+
+        :param paths: int, number of independent paths
+        :param steps: int, number of observations per path
+        :param historic_observations: list-like float or None, the collection of historic observations to pull from, None uses the observations given on creation
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: np.array of shape (paths, steps), or (paths, steps, assets) for multi asset observations
+        """
+        observations = self.observations(historic_observations)
+        indices = self.indices(paths, steps, len(observations), random_state)
+        return np.take(observations, indices, axis=0)
 
 class HistoricFilteredSimulation(_Simulation):
 
+    """
+    A _Simulation object for filtered historical simulation. A GARCH(1,1) with constant mean is fitted to historic returns by maximum likelihood, the residuals are standardized by the fitted conditional volatility, and forward paths bootstrap the standardized residuals and rescale them through the GARCH variance recursion, run across all paths at once
+
+    :param market_data: list-like float or None, historic log returns, such as the percentchange column of market_data._StockData.market_data. If given the model is fitted on creation
+    :param Generator: _RandomGen or None, draws the standardized residuals through generate_matrix(paths, steps, historic_observations, random_state), default HistoricPull
+    """
+
+    def __init__(self, market_data=None, Generator=None, **kwargs):
+        super().__init__(Generator if Generator is not None else HistoricPull(), **kwargs)
+        if market_data is not None:
+            self.fit(market_data)
+
+    @staticmethod
+    def garch_variance(residuals, omega, alpha, beta, initial):
+        """
+        Conditional variance of a GARCH(1,1), variance[t] = omega + alpha * residuals[t - 1] ** 2 + beta * variance[t - 1], as one linear filter
+
+        :param residuals: np.array, demeaned returns
+        :param omega: float, constant term
+        :param alpha: float, weight on the last squared residual
+        :param beta: float, weight on the last variance
+        :param initial: float, variance of the first observation
+
+        :return: np.array of the same shape as residuals
+        """
+        shocks = np.empty(len(residuals))
+        shocks[0] = initial
+        shocks[1:] = omega + alpha * residuals[:-1] ** 2
+        return lfilter([1], [1, -beta], shocks)
+
     def fit(self, market_data):
-        arma_model = ARMA(market_data, (1, 1))
-        arma_res = arma_model.fit(method='mle', disp=0, start_ar_lags=10)
-        garch_model = ARMA(np.square(arma_res.resid), (1, 1))
-        garch_res = garch_model.fit(method='mle', disp=0, start_ar_lags=10)
-        garch_parameters = garch_res.params
-        standardized = np.square(np.array([arma_res.resid]))
+        """
+        Fit the GARCH(1,1) by maximum likelihood and store the parameters, the conditional variance and the standardized residuals
 
-        return garch_parameters, garch_res, arma_res.resid, market_data
+        :param market_data: list-like float, historic log returns, NaN values are dropped
 
-    def simulate(self, periods_forward, number_of_simulations, market_data):
-        garch_values, model, residuals = self.fit(market_data)
+        :return: tuple, (float mean, float omega, float alpha, float beta)
+        """
+        returns = np.asarray(market_data, dtype=float)
+        returns = returns[np.isfinite(returns)]
+        mean = returns.mean()
+        # Fit on returns in percent so the parameters are of similar size for the optimizer
+        residuals = (returns - mean) * 100
+        initial = residuals.var()
+
+        def negative_log_likelihood(parameters):
+            variance = self.garch_variance(residuals, *parameters, initial)
+            return 0.5 * np.sum(np.log(variance) + residuals ** 2 / variance)
+
+        result = minimize(
+            negative_log_likelihood,
+            [initial * 0.05, 0.05, 0.9],
+            method='SLSQP',
+            bounds=[(1e-8, None), (0, 1), (0, 1)],
+            constraints=[{'type': 'ineq', 'fun': lambda parameters: 0.9999 - parameters[1] - parameters[2]}]
+        )
+        omega, alpha, beta = result.x
+        variance = self.garch_variance(residuals, omega, alpha, beta, initial) / 100 ** 2
+
+        self.mean = mean
+        self.omega = omega / 100 ** 2
+        self.alpha = alpha
+        self.beta = beta
+        self.residuals = residuals / 100
+        self.conditional_variance = variance
+        self.standardized_residuals = self.residuals / np.sqrt(variance)
+        self.fit_result = result
+        return self.mean, self.omega, self.alpha, self.beta
+
+    def generate_paths(self, periods_forward, number_of_simulations, random_state=None):
+        """
+        Function to generate a block of cumulative return paths from bootstrapped standardized residuals
+
+        :param periods_forward: int, how many steps into the future each path will take
+        :param number_of_simulations: int, how many separate paths will be generated
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: np.array of shape (number_of_simulations, periods_forward), each row is a path of cumulative log returns
+        """
+        try:
+            standardized = self.standardized_residuals
+        except AttributeError:
+            raise Exception('Must fit the model with .fit()')
+        simulations = self.Generator.generate_matrix(
+            number_of_simulations, periods_forward, standardized, random_state=random_state
+        ).astype(float)
+        # Variance of the first step follows from the last fitted observation
+        variance = np.full(
+            number_of_simulations,
+            self.omega + self.alpha * self.residuals[-1] ** 2 + self.beta * self.conditional_variance[-1]
+        )
+        for step in range(periods_forward):
+            simulations[:, step] *= np.sqrt(variance)
+            variance = self.omega + self.alpha * simulations[:, step] ** 2 + self.beta * variance
+        simulations += self.mean
+        simulations.cumsum(axis=1, out=simulations)
+        return simulations
+
+    def simulate(self, periods_forward, number_of_simulations, market_data=None):
+        """
+        Function to simulate paths of cumulative log returns
+
+        :param periods_forward: int, how many steps into the future each path will take
+        :param number_of_simulations: int, how many separate paths will be simulated
+        :param market_data: list-like float or None, if given, refit the model to these historic log returns first
+
+        :return: np.array of shape (number_of_simulations, periods_forward), each row is a path of cumulative log returns
+        """
+        if market_data is not None:
+            self.fit(market_data)
+        simulations = self.generate_paths(periods_forward, number_of_simulations)
+
+        self.set_statistics(simulations)
+
+        return(simulations)
 
 
 class BinomialDistribtion(_RandomGen):
@@ -152,37 +839,114 @@ class BinomialDistribtion(_RandomGen):
             down = 1/up
             self.probability = (np.exp(location) - down) / (up - down)
 
-    def generate(self, n, obs):
-        return np.random.binomial(n, self.probability, obs)
+    def generate(self, n, obs, random_state=None):
+        return get_random_state(random_state).binomial(n, self.probability, obs)
+
+    def generate_matrix(self, paths, steps, n=1, random_state=None):
+        """
+        Function to return a numpy.array of binomially distributed values for every path and step in one draw
+
+        :param paths: int, number of independent paths
+        :param steps: int, number of values per path
+        :param n: int, default 1, number of trials for each value
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: np.array of shape (paths, steps) of successful trial counts
+        """
+        return get_random_state(random_state).binomial(n, self.probability, (paths, steps))
+
+def crr_parameters(location, vol, resolution=1):
+    """
+    Up move, down move and risk neutral up probability of a Cox, Ross and Rubinstein tree step. Inputs can be arrays and are broadcast
+
+    :param location: float or np.array, drift per period, such as the risk free rate for pricing
+    :param vol: float or np.array, volatility per period
+    :param resolution: float or np.array, default 1, number of tree steps per period
+
+    :return: tuple, (up, down, probability)
+    """
+    step = 1 / np.asarray(resolution, dtype=float)
+    up = np.exp(location * step + vol * np.sqrt(step))
+    down = np.exp(location * step - vol * np.sqrt(step))
+    probability = (np.exp(location * step) - down) / (up - down)
+    return up, down, probability
+
 
 class CRRBinomialTree(_Simulation):
 
-    def simulate(self, vol, periods_forward, number_of_simulations, resolution=None):
+    def set_tree(self, vol, resolution=None, dtype=np.float64):
+        """
+        Helper function to set the up and down moves of the tree
 
+        :param vol: float, volatility per period
+        :param resolution: int or None, number of tree steps per period, allows for partial days and more granularity
+        :param dtype: numpy float type, default numpy.float64, precision of the generated paths, numpy.float32 halves memory use
+        """
         # Allow to adjust for partial days and more granularity
         if resolution:
-            up = np.exp(self.Generator.location/resolution + vol*np.sqrt(1/resolution))
-            down = np.exp(self.Generator.location/resolution - vol*np.sqrt(1/resolution))
-            self.Generator.probability = (np.exp(self.Generator.location/resolution) - down) / (up - down)
+            self.up, self.down, self.Generator.probability = crr_parameters(self.Generator.location, vol, resolution)
         else:
-            up = np.exp(self.Generator.location + vol)
-            down = np.exp(self.Generator.location - vol)
-
-        # Simulate a Bernoulli RV for every time step
-        simulations = np.array([
-            self.Generator.generate(1, number_of_simulations)
-            for n in range(periods_forward)
-            ])
-        # Cumulative Bernoulli RV for each path
-        simulations = simulations.cumsum(axis = 0)
-        simulations = np.array([
-            np.power(up, simulations[n]) * np.power(down, ((n+1) - simulations[n]))
-            for n in range(periods_forward)
-        ])
-        simulations = np.log(simulations.T)
-        self.simulation_mean = simulations.mean(axis=0)
-        self.simulation_std = simulations.std(axis=0)
-        self.simulated_distribution = simulations[:, -1]
+            self.up, self.down, probability = crr_parameters(self.Generator.location, vol)
+        self.dtype = np.dtype(dtype).type
+
+    def generate_paths(self, periods_forward, number_of_simulations, random_state=None):
+        """
+        Function to generate a block of logged paths through the tree, .set_tree must be called first
 
+        After k up moves in n steps a path sits at log(up ** k * down ** (n - k)), which is computed directly in log space as n * log(down) + k * (log(up) - log(down))
+
+        :param periods_forward: int, how many tree steps each path will take
+        :param number_of_simulations: int, how many paths will be generated
+        :param random_state: numpy.random.Generator or None, source of random draws, None uses the global numpy.random state
+
+        :return: np.array of shape (number_of_simulations, periods_forward)
+        """
+        dtype = getattr(self, 'dtype', np.float64)
+        log_up = np.log(self.up)
+        log_down = np.log(self.down)
+
+        # Simulate a Bernoulli RV for every time step, drawn period by period to keep the same random stream
+        simulations = self.Generator.generate_matrix(
+            periods_forward,
+            number_of_simulations,
+            random_state=random_state
+        ).T
+        # Cumulative up moves for each path
+        simulations = simulations.cumsum(axis=1, dtype=dtype)
+        simulations *= dtype(log_up - log_down)
+        simulations += np.arange(1, periods_forward + 1, dtype=dtype) * dtype(log_down)
         return simulations
 
+    def simulate(self, vol, periods_forward, number_of_simulations, resolution=None, dtype=np.float64):
+
+        self.set_tree(vol, resolution, dtype)
+        simulations = self.generate_paths(periods_forward, number_of_simulations)
+        self.set_statistics(simulations)
+
+        return simulations
+
+    def simulate_chunked(self, vol, periods_forward, number_of_simulations, chunk_size=10000, resolution=None, percentile=2.5, executor=None, seed=None, dtype=np.float64):
+        """
+        Function to run the tree simulation in blocks of paths, see _Simulation.simulate_chunked
+
+        :param vol: float, volatility per period
+        :param periods_forward: int, how many tree steps each path will take
+        :param number_of_simulations: int, how many paths will be simulated
+        :param chunk_size: int, default 10000, how many paths are generated at once
+        :param resolution: int or None, number of tree steps per period
+        :param percentile: float, default 2.5, percentile passed to .set_var once the simulation is complete
+        :param executor: concurrent.futures.Executor or None, if set, blocks are simulated with executor.map
+        :param seed: int, numpy.random.SeedSequence or None, master seed for the per block Generators
+        :param dtype: numpy float type, default numpy.float64, precision of the generated paths
+
+        :return: tuple, (np.array simulation_mean, np.array simulation_std)
+        """
+        self.set_tree(vol, resolution, dtype)
+        return super().simulate_chunked(
+            periods_forward,
+            number_of_simulations,
+            chunk_size=chunk_size,
+            percentile=percentile,
+            executor=executor,
+            seed=seed
+        )
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+
+class StressTest(object):
+    """
+    Revalues a portfolio under historical and hypothetical scenarios. Every scenario is a vector of price returns, one per position, and all scenarios are revalued at once by passing a (scenarios, positions) price matrix to PortfolioBook.valuation
+
+    :param portfolio: securities.Portfolio, the portfolio to stress
+    :param key: string, market_data column of flat prices used for historical windows
+    :param factors: DataFrame or None, factor loadings indexed by ticker or position key with a column per factor, so hypothetical shocks can be given by factor
+    """
+
+    def __init__(self, portfolio, key='adj_close', factors=None):
+        self.portfolio = portfolio
+        self.key = key
+        self.factors = factors
+        self.book = portfolio.get_book()
+        # Revalue from the latest prices even if the market data was refreshed outside the portfolio
+        self.book.refresh()
+        self.panel = portfolio.get_portfolio_panel(key)
+        self.tickers = [getattr(security, 'ticker', security.name) for security in self.book.securities]
+        self.base_value = self.book.valuation(self.book.current_price)
+
+    def historical(self, windows):
+        """
+        Price returns of each position over historical windows of the panel, p_end / p_start - 1, using the nearest panel dates on or before start and end
+
+        :param windows: dict of scenario name to (start, end) dates, such as {'2008-09': ('2008-09-01', '2009-03-09')}
+
+        :return: DataFrame of price returns, a row per scenario and a column per position
+        """
+        names = list(windows)
+        starts = pd.DatetimeIndex([windows[i][0] for i in names])
+        ends = pd.DatetimeIndex([windows[i][1] for i in names])
+        first, last = self.panel.index[0], self.panel.index[-1]
+        outside = [
+            name for name, start, end in zip(names, starts, ends)
+            if start < first or start > last or end < first or end > last
+        ]
+        if outside:
+            raise ValueError(
+                'Historical windows outside the market data, {:%Y-%m-%d} to {:%Y-%m-%d}: '.format(first, last)
+                + ', '.join(str(i) for i in outside)
+            )
+        start_rows = self.panel.index.searchsorted(starts, side='right') - 1
+        end_rows = self.panel.index.searchsorted(ends, side='right') - 1
+        shocks = self.panel.values[end_rows] / self.panel.values[start_rows] - 1
+        return pd.DataFrame(shocks, index=names, columns=self.book.keys)
+
+    def rolling_windows(self, length=10):
+        """
+        Every historical window of length periods in the panel as a scenario, named by its end date
+
+        :param length: int, number of periods in each window
+
+        :return: DataFrame of price returns, a row per window and a column per position
+        """
+        values = self.panel.values
+        shocks = values[length:] / values[:-length] - 1
+        return pd.DataFrame(shocks, index=self.panel.index[length:].strftime('%Y-%m-%d'), columns=self.book.keys)
+
+    def hypothetical(self, shocks):
+        """
+        Price returns of each position from shocks given by ticker, position key or factor. A factor shock moves each position by its loading times the shock, and is added to any direct shock
+
+        :param shocks: dict of scenario name to dict of ticker, position key or factor name to price return, such as {'tech selloff': {'AAPL': -0.2, 'market': -0.05}}
+
+        :return: DataFrame of price returns, a row per scenario and a column per position
+        """
+        names = list(shocks)
+        output = np.zeros((len(names), len(self.book.keys)))
+        loadings = None
+        if self.factors is not None:
+            # Loadings may be indexed by position key or by ticker
+            loadings = pd.DataFrame(
+                [
+                    self.factors.loc[key] if key in self.factors.index
+                    else self.factors.loc[ticker] if ticker in self.factors.index
+                    else pd.Series(0.0, index=self.factors.columns)
+                    for key, ticker in zip(self.book.keys, self.tickers)
+                ],
+                index=self.book.keys
+            )
+        for row, name in enumerate(names):
+            for target, shock in shocks[name].items():
+                if loadings is not None and target in loadings.columns:
+                    output[row] += loadings[target].values * shock
+                else:
+                    columns = [i for i, (key, ticker) in enumerate(zip(self.book.keys, self.tickers)) if target in (key, ticker)]
+                    if not columns:
+                        raise Exception(str(target) + ' is not a position, ticker or factor in the portfolio')
+                    output[row, columns] += shock
+        return pd.DataFrame(output, index=names, columns=self.book.keys)
+
+    def revalue(self, shocks):
+        """
+        Profit and loss of each position under every scenario, from one valuation of the (scenarios, positions) price matrix
+
+        :param shocks: DataFrame of price returns, a row per scenario and a column per position
+
+        :return: DataFrame of profit and loss, a column per position and a total column, sorted from the worst total
+        """
+        prices = self.book.current_price * (1 + shocks.loc[:, self.book.keys].values)
+        profit = self.book.valuation(prices) - self.base_value
+        output = pd.DataFrame(profit, index=shocks.index, columns=self.book.keys)
+        output['total'] = profit.sum(axis=1)
+        return output.sort_values('total')
+
+    def run(self, historical=None, hypothetical=None, window_length=None):
+        """
+        Build and revalue every scenario together
+
+        :param historical: dict or None, scenario name to (start, end) dates, see .historical
+        :param hypothetical: dict or None, scenario name to shocks, see .hypothetical
+        :param window_length: int or None, if set include every historical window of this many periods, see .rolling_windows
+
+        :return: DataFrame of profit and loss, a column per position and a total column, sorted from the worst total
+        """
+        shocks = []
+        if historical:
+            shocks.append(self.historical(historical))
+        if hypothetical:
+            shocks.append(self.hypothetical(hypothetical))
+        if window_length:
+            shocks.append(self.rolling_windows(window_length))
+        if not shocks:
+            raise Exception('Pass historical, hypothetical or window_length scenarios')
+        self.shocks = pd.concat(shocks)
+        self.results = self.revalue(self.shocks)
+        return self.results
+
+    def worst(self, n=10):
+        """
+        Returns the n worst scenarios of the last .run
+
+        :param n: int, number of scenarios
+
+        :return: DataFrame of profit and loss
+        """
+        try:
+            return self.results.head(n)
+        except AttributeError:
+            raise Exception('Must run scenarios with .run()')
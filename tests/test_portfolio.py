@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('quandl')
+
+from risk_dash import market_data as md, securities as sec
+
+
+@pytest.fixture
+def portfolio(tmp_path):
+    files = md.generate_synthetic_market_data(['AAA', 'BBB', 'CCC'], years=3, start='2013-01-01', directory=str(tmp_path), file_format='csv', seed=2)
+    data = {ticker: md.LocalStockData(path, ticker, days=2000) for ticker, path in files.items()}
+    return sec.Portfolio([sec.Equity(ticker, data[ticker], 100, 10, '2013-02-01') for ticker in data])
+
+
+def mean_portfolio_return(portfolio):
+    weights = portfolio.get_weights()
+    returns = pd.concat(
+        [security.get_marketdata().market_data['percentchange'] * weights[key] for key, security in portfolio.port.items()],
+        axis=1
+    ).dropna()
+    return returns.sum(axis=1).mean()
+
+
+@pytest.mark.parametrize('first_key', [None, 'adj_close'])
+def test_market_data_follows_set_port_variance_key(portfolio, first_key):
+    if first_key is not None:
+        portfolio.get_portfolio_marketdata(first_key)
+    portfolio.quick_plot(plot=False)
+    variance, value_at_risk = portfolio.set_port_variance(key='percentchange')
+    assert portfolio.market_data_key == 'percentchange'
+    assert np.isclose(np.mean(portfolio.market_data['portfolio']), mean_portfolio_return(portfolio))
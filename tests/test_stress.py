@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('quandl')
+
+from risk_dash import market_data as md, securities as sec
+
+
+def build_portfolio(directory, drop=0):
+    files = md.generate_synthetic_market_data(['AAA', 'BBB'], years=3, start='2013-01-01', directory=str(directory), file_format='csv', seed=1)
+    if drop:
+        for path in files.values():
+            pd.read_csv(path).iloc[:-drop].to_csv(path, index=False)
+    data = {ticker: md.LocalStockData(path, ticker, days=2000) for ticker, path in files.items()}
+    portfolio = sec.Portfolio([sec.Equity(ticker, data[ticker], 100, 10, '2013-02-01') for ticker in data])
+    return portfolio, data
+
+
+@pytest.mark.parametrize('window', [('2008-09-01', '2009-03-09'), ('2014-01-02', '2030-01-01')])
+def test_historical_window_outside_market_data(tmp_path, window):
+    portfolio, data = build_portfolio(tmp_path)
+    with pytest.raises(ValueError):
+        portfolio.stress_test(historical={'window': window})
+
+
+def test_historical_window_inside_market_data(tmp_path):
+    portfolio, data = build_portfolio(tmp_path)
+    results = portfolio.stress_test(historical={'window': ('2014-01-02', '2015-01-02')})
+    prices = data['AAA'].market_data['adj_close']
+    expected = (prices[:'2015-01-02'].iloc[-1] / prices[:'2014-01-02'].iloc[-1] - 1) * prices.iloc[-1] * 10
+    assert np.isclose(results.loc['window', 'AAA Equity'], expected)
+
+
+def test_hypothetical_uses_refreshed_prices(tmp_path):
+    portfolio, data = build_portfolio(tmp_path, drop=40)
+    stale = portfolio.get_book().current_price.copy()
+    md.generate_synthetic_market_data(['AAA', 'BBB'], years=3, start='2013-01-01', directory=str(tmp_path), file_format='csv', seed=1)
+    for ticker in data:
+        data[ticker].refresh()
+    results = portfolio.stress_test(hypothetical={'selloff': {'AAA': -0.1}})
+    current = data['AAA'].current_price()
+    assert current != stale[0]
+    assert np.isclose(results.loc['selloff', 'AAA Equity'], -0.1 * 10 * current)
+    assert portfolio.get_last_shared_date() == data['AAA'].market_data.index[-1]